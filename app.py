@@ -3,27 +3,39 @@ REPA - Real Estate Personalized Assistant
 A minimal demo app for the LangFlow-based apartment matching workflow
 """
 
-from fastapi import FastAPI, HTTPException, Depends, status, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, status, BackgroundTasks, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Optional, List, AsyncIterator
 import os
 import json
-import requests
+import orjson
+import time
+import hashlib
+import hmac
+import uuid
+import threading
+from functools import lru_cache
+from types import MappingProxyType
+import httpx
 import re
+import html
 import imaplib
 import email
 from email.header import decode_header
+from email.parser import BytesHeaderParser
 from email.utils import parsedate_to_datetime
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
+from cachetools import TTLCache
 from supabase import create_client, Client
-from jose import JWTError, jwt
-from datetime import datetime, timedelta
+import jwt
+from datetime import datetime, timedelta, timezone
 import asyncio
+import anyio
 import logging
 
 # Load environment variables
@@ -33,7 +45,12 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="REPA - Real Estate Personalized Assistant")
+# orjson-backed responses; endpoints that already build their response model
+# return ORJSONResponse directly so FastAPI doesn't re-validate and re-encode it
+app = FastAPI(
+    title="REPA - Real Estate Personalized Assistant",
+    default_response_class=ORJSONResponse
+)
 
 # Enable CORS
 # Note: When allow_credentials=True, browsers reject allow_origins=["*"] for security
@@ -81,6 +98,34 @@ else:
     supabase_admin: Client = supabase
     logger.warning("SUPABASE_SERVICE_KEY not set - admin operations will use anon key (may fail with RLS)")
 
+# Backend queries run in the threadpool; size both the pool and the PostgREST
+# connection pool so bursts of requests don't queue behind a handful of workers
+THREADPOOL_SIZE = 200
+POSTGREST_POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+
+
+def configure_postgrest_pool(client: Client) -> None:
+    """Replace the client's PostgREST HTTP session with one using a larger connection pool"""
+    postgrest = client.postgrest
+    session = postgrest.session
+    postgrest.session = httpx.Client(
+        base_url=session.base_url,
+        headers=session.headers,
+        timeout=session.timeout,
+        follow_redirects=True,
+        http2=True,
+        limits=POSTGREST_POOL_LIMITS
+    )
+    session.close()
+
+
+# Only a dedicated service-role client keeps the larger pool: supabase-py rebuilds the anon
+# client's PostgREST session on every auth event, which would silently drop it
+if supabase_admin is not supabase:
+    configure_postgrest_pool(supabase_admin)
+else:
+    logger.warning("SUPABASE_SERVICE_KEY not set - backend queries use the default PostgREST connection pool")
+
 # JWT settings
 JWT_SECRET = os.getenv("JWT_SECRET", SUPABASE_KEY)  # Use Supabase key as JWT secret
 JWT_ALGORITHM = "HS256"
@@ -95,6 +140,41 @@ logger.info(f"JWT configured with algorithm {JWT_ALGORITHM}, expiration {JWT_EXP
 # Security
 security = HTTPBearer()
 
+# Recently verified tokens keyed by SHA-256 of the token, so an active session
+# doesn't pay for a full JWT decode on every request. Values are (user_id, exp).
+TOKEN_CACHE_TTL_SECONDS = 30
+_token_cache = TTLCache(maxsize=10_000, ttl=TOKEN_CACHE_TTL_SECONDS)
+_token_cache_lock = threading.Lock()
+
+# Successful Firecrawl scrapes keyed by listing URL (per process)
+SCRAPE_CACHE_TTL_SECONDS = 3600
+_scrape_cache = TTLCache(maxsize=1024, ttl=SCRAPE_CACHE_TTL_SECONDS)
+
+# user_criteria rows keyed by user_id; reads on the email and profile paths share them.
+# Every write path invalidates its user's entry.
+CRITERIA_CACHE_TTL_SECONDS = 60
+_criteria_cache = TTLCache(maxsize=1024, ttl=CRITERIA_CACHE_TTL_SECONDS)
+
+# Most image URLs kept per scraped listing
+MAX_LISTING_IMAGES = 16
+
+# Listings with more images than this are analyzed one request per image
+MAX_BATCHED_IMAGES = 8
+
+# Precompiled patterns used on every chat request
+_URL_RE = re.compile(r'(https?://[^\s]+)')
+_IMG_MD_RE = re.compile(r'!\[.*?\]\((https://[^\)]+\.(?:jpg|jpeg|png|webp))\)', re.IGNORECASE)
+_IMG_RAW_RE = re.compile(r'https://[^\s<>"]+\.(?:jpg|jpeg|png|webp)', re.IGNORECASE)
+_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+# Property sites whose listing links are picked out of alert emails
+_PROPERTY_DOMAINS = ('homegate.ch', 'immoscout24.ch', 'flatfox.ch')
+# One alternation over every domain finds a hit in a single pass, however many sites are listed
+_PROPERTY_DOMAIN_PATTERN = '|'.join(map(re.escape, _PROPERTY_DOMAINS))
+# [^\s<>"'] already excludes newlines, so a single scan finds URLs on separate lines too.
+# It also stops at attribute quotes, so it finds href values in HTML bodies without parsing them.
+_PROPERTY_URL_RE = re.compile(rf'https?://[^\s<>"\']*(?:{_PROPERTY_DOMAIN_PATTERN})[^\s<>"\']*', re.IGNORECASE)
+
 
 class ChatRequest(BaseModel):
     message: str
@@ -173,9 +253,9 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
     to_encode = data.copy()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = datetime.now(timezone.utc) + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS)
+        expire = datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
     return encoded_jwt
@@ -184,6 +264,14 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Verify JWT token and return user_id"""
     token = credentials.credentials
+    token_hash = hashlib.sha256(token.encode()).digest()
+    with _token_cache_lock:
+        cached = _token_cache.get(token_hash)
+    if cached is not None:
+        user_id, exp = cached
+        # Never serve a cached token past its own expiry
+        if exp is None or exp > time.time():
+            return user_id
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
         user_id: str = payload.get("sub")
@@ -195,6 +283,8 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
                 headers={"WWW-Authenticate": "Bearer"},
             )
         logger.debug(f"Token verified for user_id: {user_id}")
+        with _token_cache_lock:
+            _token_cache[token_hash] = (user_id, payload.get("exp"))
         return user_id
     except jwt.ExpiredSignatureError:
         logger.warning("Token expired")
@@ -203,7 +293,7 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
             detail="Token expired. Please login again.",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    except jwt.JWTError as e:
+    except jwt.InvalidTokenError as e:
         logger.error(f"JWT verification error: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -219,23 +309,56 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
         )
 
 
+def get_http_client(request: Request) -> httpx.AsyncClient:
+    """Return the shared outbound HTTP client created on startup"""
+    return request.app.state.http
+
+
+def get_openai_client(request: Request) -> httpx.AsyncClient:
+    """Return the shared OpenAI API client created on startup"""
+    return request.app.state.openai
+
+
+async def load_user_criteria(user_id: str) -> Optional[dict]:
+    """Fetch a user's criteria row (shared and cached; copy before mutating)"""
+    criteria = _criteria_cache.get(user_id)
+    if criteria is not None:
+        return criteria
+    query = supabase_admin.table("user_criteria").select("*").eq("user_id", user_id)
+    response = await run_in_threadpool(query.execute)
+    if not response.data:
+        return None
+    criteria = _criteria_cache[user_id] = response.data[0]
+    return criteria
+
+
+def invalidate_user_criteria(user_id: str) -> None:
+    """Drop a user's cached criteria after it changes"""
+    _criteria_cache.pop(user_id, None)
+
+
 def extract_url_from_message(message: str) -> tuple[str, str]:
     """Extract URL from message and return cleaned message and URL"""
-    url_pattern = r'(https?://[^\s]+)'
-    urls = re.findall(url_pattern, message)
+    # Most chat messages contain no URL; skip the regex entirely for those
+    if 'http' not in message:
+        return message, ""
     
-    if urls:
-        # Get the first URL
-        url = urls[0]
-        # Remove URL from message
-        clean_message = re.sub(url_pattern, '', message).strip()
-        return clean_message, url
+    match = _URL_RE.search(message)
+    if match:
+        # Cut the first URL out of the message instead of re-scanning with sub()
+        clean_message = (message[:match.start()] + message[match.end():]).strip()
+        return clean_message, match.group(1)
     
     return message, ""
 
 
-def call_firecrawl_scraper(url: str) -> dict:
+async def call_firecrawl_scraper(client: httpx.AsyncClient, url: str) -> dict:
     """Scrape the listing URL using Firecrawl API"""
+    # Users often re-send the same listing while refining their criteria
+    cached = _scrape_cache.get(url)
+    if cached is not None:
+        return cached
+    
     api_key = os.getenv("FIRECRAWL_API_KEY")
     if not api_key:
         raise ValueError("FIRECRAWL_API_KEY not found in environment")
@@ -251,24 +374,30 @@ def call_firecrawl_scraper(url: str) -> dict:
     }
     
     try:
-        response = requests.post(
+        response = await client.post(
             "https://api.firecrawl.dev/v1/scrape",
-            json=payload,
+            content=orjson.dumps(payload),
             headers=headers,
             timeout=30
         )
         response.raise_for_status()
-        result = response.json()
+        result = orjson.loads(response.content)
         
         if result.get("success"):
             data = result.get("data", {})
-            return {
-                "content": data.get("markdown", data.get("html", "")),
+            metadata = data.get("metadata") or {}
+            listing = {
+                "content": data.get("markdown") or data.get("html", ""),
                 "url": url,
-                "metadata": data.get("metadata", {}),
-                "title": data.get("metadata", {}).get("title", ""),
-                "description": data.get("metadata", {}).get("description", ""),
+                "metadata": metadata,
+                "title": metadata.get("title", ""),
+                "description": metadata.get("description", ""),
             }
+            # Find the listing's images once here so analysis doesn't re-scan the content
+            listing["images"] = extract_listing_images(listing["content"], listing["metadata"])
+            # Only successful scrapes are cached so failures are retried
+            _scrape_cache[url] = listing
+            return listing
         else:
             return {"error": result.get("error", "Unknown error")}
     
@@ -276,108 +405,68 @@ def call_firecrawl_scraper(url: str) -> dict:
         return {"error": str(e)}
 
 
-def extract_criteria_with_openai(user_message: str) -> dict:
-    """Extract apartment criteria from user message using OpenAI"""
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY not found in environment")
-    
-    system_prompt = """You are an expert at extracting structured apartment rental/purchase criteria from natural language.
-
-Extract information from the user's request and return it as valid JSON.
-
-IMPORTANT: Only include fields that the user explicitly mentions. Do NOT include fields with null values.
+def nullable(json_type: str, description: str) -> dict:
+    """JSON Schema for an optional value (strict structured outputs require every key)"""
+    return {"type": [json_type, "null"], "description": description}
+
+
+# Structured-output schema for criteria extraction. Strict mode guarantees the
+# model returns exactly these keys; unmentioned fields come back as null.
+CRITERIA_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "property_type": {
+            "type": ["string", "null"],
+            "enum": ["rent", "buy", None],
+            "description": "Whether the user wants to rent or buy"
+        },
+        "location": nullable("string", "City, postal code, area, or proximity requirement"),
+        "min_rooms": nullable("number", "Minimum number of rooms"),
+        "max_rooms": nullable("number", "Maximum number of rooms"),
+        "min_living_space": nullable("number", "Minimum living space in square meters"),
+        "max_living_space": nullable("number", "Maximum living space in square meters"),
+        "min_rent": nullable("number", "Minimum rent in CHF (rentals only)"),
+        "max_rent": nullable("number", "Maximum rent in CHF (rentals only)"),
+        "occupants": nullable("number", "Number of people who will live there"),
+        "duration": nullable("string", 'How long they need it, e.g. "ski season", "6 months", "long-term"'),
+        "additional_requirements": {
+            "type": "array",
+            "items": {"type": "string"},
+            "description": "Every other requirement (pet-friendly, balcony, parking, proximity to amenities, etc.), one per item"
+        }
+    },
+    "required": [
+        "property_type", "location", "min_rooms", "max_rooms", "min_living_space", "max_living_space",
+        "min_rent", "max_rent", "occupants", "duration", "additional_requirements"
+    ],
+    "additionalProperties": False
+}
 
-Available field names you may use (only if mentioned):
-- property_type: "rent" or "buy" (string) - Extract if user mentions "rent", "rental", "lease", "buy", "purchase", "for sale", "to buy"
-- location: The city, postal code, area, or proximity requirement (string)
-- min_rooms: Minimum number of rooms (number)
-- max_rooms: Maximum number of rooms (number)
-- min_living_space: Minimum living space in square meters (number)
-- max_living_space: Maximum living space in square meters (number)
-- min_rent: Minimum rent in CHF (number) - only for rentals
-- max_rent: Maximum rent in CHF (number) - only for rentals
-- occupants: Number of people who will live there (number)
-- duration: How long they need it (string, e.g., "ski season", "6 months", "long-term") - typically for rentals
+CRITERIA_SYSTEM_PROMPT = """You are an expert at extracting structured apartment rental/purchase criteria from natural language.
 
-For ANY other requirements (pet-friendly, balcony, parking, proximity to amenities, etc.), add them to an "additional_requirements" array.
+Only fill in fields the user explicitly mentions; use null for everything else.
 
 Extraction Rules:
-1. If user says "rent", "rental", "lease", "to rent" → use "property_type": "rent"
-2. If user says "buy", "purchase", "for sale", "to buy" → use "property_type": "buy"
+1. If user says "rent", "rental", "lease", "to rent" → property_type "rent"
+2. If user says "buy", "purchase", "for sale", "to buy" → property_type "buy"
 3. If not specified, default to "rent" (most common)
-4. If "for X persons/people" → use "occupants": X
-5. If "ski season" or temporary → use "duration": "ski season" or appropriate period
-6. If "price is not a problem" or "budget flexible" → do NOT include min_rent or max_rent
-7. If "more than X rooms" → use "min_rooms": X
-8. If "less than CHF Y" → use "max_rent": Y (for rent) or note as price range (for buy)
-9. If "about X square meters" → use both "min_living_space" and "max_living_space" with ±10% range
+4. If "for X persons/people" → occupants X
+5. If "ski season" or temporary → duration "ski season" or appropriate period
+6. If "price is not a problem" or "budget flexible" → leave min_rent and max_rent null
+7. If "more than X rooms" → min_rooms X
+8. If "less than CHF Y" → max_rent Y (for rent) or note as price range (for buy)
+9. If "about X square meters" → set both min_living_space and max_living_space with a ±10% range
 10. Location can be specific (city/postal code) OR proximity-based ("close to ski", "near train station")
 11. Extract EACH specific requirement as a separate item in additional_requirements
 12. Preserve the user's exact wording and intent
-13. Infer room requirements from occupancy if helpful (e.g., 5 persons might suggest larger apartment)
-14. Return ONLY valid JSON, no explanations
-
-Example 1 - Rental with full numeric criteria:
-Input: "I am looking to rent an apartment in 8008 Zürich, more than 4 rooms, living space about 100 square meters, and rent less than CHF 5000."
-Output:
-{
-  "property_type": "rent",
-  "location": "8008 Zürich",
-  "min_rooms": 4,
-  "min_living_space": 90,
-  "max_living_space": 110,
-  "max_rent": 5000
-}
+13. Infer room requirements from occupancy if helpful (e.g., 5 persons might suggest larger apartment)"""
 
-Example 2 - Purchase:
-Input: "I want to buy an apartment in Zürich, 3-4 rooms, around 100m²"
-Output:
-{
-  "property_type": "buy",
-  "location": "Zürich",
-  "min_rooms": 3,
-  "max_rooms": 4,
-  "min_living_space": 90,
-  "max_living_space": 110
-}
 
-Example 3 - Seasonal rental:
-Input: "I'm visiting Switzerland for a ski season and need to rent an apartment for 5 persons, need it to be super close to the ski action. Price is not a problem."
-Output:
-{
-  "property_type": "rent",
-  "occupants": 5,
-  "duration": "ski season",
-  "location": "ski resort area",
-  "additional_requirements": ["close to ski slopes", "ski-in/ski-out preferred", "suitable for 5 people"]
-}
-
-Example 4 - Rental with mixed criteria:
-Input: "Looking to rent 3 rooms in Zürich, max CHF 3000, with parking space, balcony, and modern kitchen"
-Output:
-{
-  "property_type": "rent",
-  "location": "Zürich",
-  "min_rooms": 3,
-  "max_rent": 3000,
-  "additional_requirements": ["parking space", "balcony", "modern kitchen"]
-}
-
-Example 5 - Only location (defaults to rent):
-Input: "I need an apartment in Bern"
-Output:
-{
-  "property_type": "rent",
-  "location": "Bern"
-}
-
-Now extract the criteria:"""
-
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+async def extract_criteria_with_openai(openai: httpx.AsyncClient, user_message: str) -> dict:
+    """Extract apartment criteria from user message using OpenAI"""
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY not found in environment")
     
     user_prompt = f"""Now extract the criteria from the User's Request:
 <user_request>
@@ -387,130 +476,195 @@ Now extract the criteria:"""
     payload = {
         "model": "gpt-4o-mini",
         "messages": [
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": CRITERIA_SYSTEM_PROMPT},
             {"role": "user", "content": user_prompt}
         ],
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": "criteria", "schema": CRITERIA_JSON_SCHEMA, "strict": True}
+        },
         "temperature": 0.1
     }
     
     try:
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            json=payload,
-            headers=headers,
+        response = await openai.post(
+            "/chat/completions",
+            content=orjson.dumps(payload),
             timeout=30
         )
         response.raise_for_status()
-        result = response.json()
+        result = orjson.loads(response.content)
         
-        criteria_text = result['choices'][0]['message']['content']
-        # Try to parse as JSON
-        try:
-            criteria = json.loads(criteria_text)
-            return criteria
-        except json.JSONDecodeError:
-            # Try to extract JSON from markdown code blocks
-            json_match = re.search(r'```json\s*(.*?)\s*```', criteria_text, re.DOTALL)
-            if json_match:
-                criteria = json.loads(json_match.group(1))
-                return criteria
-            return {"error": "Failed to parse criteria as JSON"}
+        criteria = orjson.loads(result['choices'][0]['message']['content'])
+        # Drop unmentioned fields so callers only see what the user asked for
+        return {key: value for key, value in criteria.items() if value is not None and value != []}
     
     except Exception as e:
         return {"error": str(e)}
 
 
-def analyze_images(listing_content: str, max_images: int = 5) -> str:
+def first_unique_matches(pattern: re.Pattern, text: str, limit: int) -> List[str]:
+    """Return up to `limit` distinct matches of `pattern` in order of appearance"""
+    group = 1 if pattern.groups else 0
+    seen = set()
+    matches = []
+    for match in pattern.finditer(text):
+        value = match.group(group)
+        if value not in seen:
+            seen.add(value)
+            matches.append(value)
+            # Stop scanning as soon as we have enough
+            if len(matches) >= limit:
+                break
+    return matches
+
+
+def extract_listing_images(content: str, metadata: dict, limit: int = MAX_LISTING_IMAGES) -> List[str]:
+    """Collect up to `limit` unique image URLs for a scraped listing"""
+    urls = []
+    # Cheap substring gate: skip both regex scans when no image can match
+    content_lower = content.lower()
+    if any(ext in content_lower for ext in _IMAGE_EXTENSIONS):
+        # Extract image URLs from markdown - support multiple image formats
+        if "![" in content:
+            urls = first_unique_matches(_IMG_MD_RE, content, limit)
+        
+        # If no markdown images found, try to extract raw image URLs
+        if not urls:
+            urls = first_unique_matches(_IMG_RAW_RE, content, limit)
+    
+    # The Open Graph image is usually the listing's main photo
+    og_image = metadata.get("ogImage")
+    if isinstance(og_image, str) and og_image.startswith("https://") and og_image not in urls:
+        urls = [og_image] + urls[:limit - 1]
+    
+    return urls
+
+
+# Compact image classification prompts: decode time dominates these calls, so
+# ask for a small JSON object and render it server-side
+IMAGE_ANALYSIS_MAX_TOKENS = 120
+IMAGE_ANALYSIS_FIELDS = '"room": str, "features": [3 short str], "furnished": "yes"|"no"|"partial", "score": 1-10'
+IMAGE_ANALYSIS_PROMPT = f"Apartment listing photo. Return JSON {{{IMAGE_ANALYSIS_FIELDS}}}."
+IMAGE_BATCH_ANALYSIS_PROMPT = (
+    "{count} apartment listing photos, in order. "
+    f'Return JSON {{"images": [{{"index": 1-based photo number, {IMAGE_ANALYSIS_FIELDS}}}]}}, one entry per photo.'
+)
+
+
+def format_image_analysis(analysis: dict) -> str:
+    """Render a structured image classification as markdown for the match report prompt"""
+    features = ", ".join(str(feature) for feature in analysis.get("features") or [])
+    return (
+        f"**Room:** {analysis.get('room', 'unknown')}\n"
+        f"**Features:** {features or 'n/a'}\n"
+        f"**Furnished:** {analysis.get('furnished', 'unknown')}\n"
+        f"**Overall impression:** {analysis.get('score', '?')}/10"
+    )
+
+
+async def analyze_images(openai: httpx.AsyncClient, image_urls: List[str], max_images: int = 5) -> str:
     """Analyze listing images using OpenAI Vision API"""
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         return "Image analysis skipped (no API key)"
     
-    # Extract image URLs from markdown - support multiple image formats
-    pattern = r'!\[.*?\]\((https://[^\)]+\.(?:jpg|jpeg|png|webp))\)'
-    urls = re.findall(pattern, listing_content, re.IGNORECASE)
-    
-    # If no markdown images found, try to extract raw image URLs
-    if not urls:
-        pattern_raw = r'https://[^\s<>"]+\.(?:jpg|jpeg|png|webp)'
-        urls = re.findall(pattern_raw, listing_content, re.IGNORECASE)
-    
+    urls = image_urls[:max_images]
     if not urls:
         return "No images found to analyze"
     
-    # Limit images
-    urls = list(set(urls))[:max_images]
+    logger.debug("[Image Analysis] Found %d unique images to analyze", len(urls))
+    
+    def image_part(url: str) -> dict:
+        return {
+            "type": "image_url",
+            "image_url": {
+                "url": url,
+                "detail": "low"
+            }
+        }
     
-    print(f"[Image Analysis] Found {len(urls)} unique images to analyze")
+    async def post_chat_completion(payload: dict) -> dict:
+        response = await openai.post(
+            "/chat/completions",
+            content=orjson.dumps(payload),
+            timeout=30
+        )
+        response.raise_for_status()
+        result = orjson.loads(response.content)
+        return orjson.loads(result['choices'][0]['message']['content'])
     
-    analyses = []
-    for idx, url in enumerate(urls):
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
+    async def analyze_batch() -> list:
+        # All images in one request: one round-trip and one prompt prefill
+        text = IMAGE_BATCH_ANALYSIS_PROMPT.replace("{count}", str(len(urls)))
+        payload = {
+            "model": "gpt-4o-mini",
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [{"type": "text", "text": text}] + [image_part(url) for url in urls]
+                }
+            ],
+            "response_format": {"type": "json_object"},
+            "max_tokens": IMAGE_ANALYSIS_MAX_TOKENS * len(urls)
         }
-        
+        items = (await post_chat_completion(payload))["images"]
+        by_index = {item.get("index"): item for item in items}
+        return [
+            format_image_analysis(by_index[idx + 1]) if idx + 1 in by_index
+            else ValueError("No analysis returned for this image")
+            for idx in range(len(urls))
+        ]
+    
+    async def analyze_one(url: str) -> str:
         payload = {
             "model": "gpt-4o-mini",
             "messages": [
                 {
                     "role": "user",
                     "content": [
-                        {
-                            "type": "text",
-                            "text": """Analyze this apartment/property image. Identify:
-1. Room type (living room, bedroom, kitchen, bathroom, exterior, view, etc.)
-2. Key features and condition (modern, renovated, spacious, natural light, etc.)
-3. Furnishing status (furnished, unfurnished, partially furnished)
-4. Notable amenities or highlights
-5. Overall impression (scale 1-10)
-
-Be concise but specific. Focus on details that would matter to a renter."""
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": url,
-                                "detail": "low"
-                            }
-                        }
+                        {"type": "text", "text": IMAGE_ANALYSIS_PROMPT},
+                        image_part(url)
                     ]
                 }
             ],
-            "max_tokens": 300
+            "response_format": {"type": "json_object"},
+            "max_tokens": IMAGE_ANALYSIS_MAX_TOKENS
         }
-        
+        return format_image_analysis(await post_chat_completion(payload))
+    
+    results = None
+    if len(urls) <= MAX_BATCHED_IMAGES:
         try:
-            response = requests.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
-            result = response.json()
-            analysis = result['choices'][0]['message']['content']
+            results = await analyze_batch()
+        except Exception as e:
+            logger.warning("[Image Analysis] Batched request failed, falling back to per-image requests: %s", e)
+    
+    if results is None:
+        # Dispatch all image requests concurrently; results come back in input order
+        results = await asyncio.gather(
+            *(analyze_one(url) for url in urls),
+            return_exceptions=True
+        )
+    
+    analyses = []
+    for idx, (url, analysis) in enumerate(zip(urls, results)):
+        if isinstance(analysis, Exception):
+            analyses.append(f"### Image {idx + 1}\n**Image URL:** {url}\n❌ Analysis failed: {str(analysis)}\n\n---\n\n")
+        else:
             # IMPORTANT: Include the URL so the LLM can extract it and display the image
             analyses.append(f"### Image {idx + 1}\n**Image URL:** {url}\n\n{analysis}\n\n---\n\n")
-        except Exception as e:
-            analyses.append(f"### Image {idx + 1}\n**Image URL:** {url}\n❌ Analysis failed: {str(e)}\n\n---\n\n")
     
     summary = "\n".join(analyses)
-    print(f"[Image Analysis] Completed. Sample output: {summary[:300]}...")
+    logger.debug("[Image Analysis] Completed. Sample output: %.300s...", summary)
     return summary
 
 
-def generate_match_report(criteria: dict, listing_data: dict, image_analysis: str = "") -> str:
-    """Generate the final match report using OpenAI"""
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY not found in environment")
-    
-    # Debug: Check what we're receiving
-    print(f"[Debug generate_match_report] image_analysis length: {len(image_analysis) if image_analysis else 0}")
-    print(f"[Debug generate_match_report] Has valid image analysis: {bool(image_analysis and image_analysis not in ['No images found to analyze', 'Image analysis skipped (no API key)'])}")
-    
-    system_prompt = """You are a helpful apartment rental/purchase advisor for the Swiss market. Your job is to analyze apartment listings and help users determine if they're a good match for their needs.
+# Placeholder results analyze_images returns when there are no images to show
+NO_IMAGE_ANALYSIS_RESULTS = ("No images found to analyze", "Image analysis skipped (no API key)")
+
+# Static parts of the match report prompt, built once at import time
+MATCH_REPORT_SYSTEM_PROMPT = """You are a helpful apartment rental/purchase advisor for the Swiss market. Your job is to analyze apartment listings and help users determine if they're a good match for their needs.
 
 ## Your Approach:
 - Be friendly, conversational, and encouraging
@@ -537,18 +691,7 @@ def generate_match_report(criteria: dict, listing_data: dict, image_analysis: st
 
 Follow the exact output format provided in the user's request."""
 
-    # Determine if we have images to display
-    has_images = image_analysis and image_analysis not in ["No images found to analyze", "Image analysis skipped (no API key)"]
-    
-    image_analysis_section = ""
-    if has_images:
-        image_analysis_section = f"""## Image Analysis Results:
-{image_analysis}
-"""
-    
-    image_gallery_section = ""
-    if has_images:
-        image_gallery_section = """## 📸 Photo Analysis
+MATCH_REPORT_GALLERY_SECTION = """## 📸 Photo Analysis
 
 **INSTRUCTION:** Extract all image URLs from the Image Analysis section and create a beautiful photo gallery here. For each analyzed image:
 1. Display the image using: ![Room Name](image_url)
@@ -564,32 +707,16 @@ Example format:
 *Fully equipped kitchen with modern appliances and ample counter space.*
 
 Continue for all analyzed images..."""
-    
-    with_images = " with photo gallery" if has_images else ""
 
-    # Build the user prompt
-    property_type_note = ""
-    if criteria.get('property_type'):
-        property_type_note = f"\n**IMPORTANT:** User is looking to {criteria.get('property_type')} (not {'buy' if criteria.get('property_type') == 'rent' else 'rent'}). Only recommend listings that match this property type."
-    
-    prompt = f"""User's criteria:
-```json
-{json.dumps(criteria, indent=2)}
-```
-{property_type_note}
-
-Listing data:
-<listing>
-{listing_data.get('content', '')}
-</listing>
-
-{image_analysis_section}
+MATCH_REPORT_TASK_HEADER = """
 
 ---
 
 ## Your Task:
 
-Analyze this apartment listing and create a beautiful, user-friendly match report{with_images}.
+Analyze this apartment listing and create a beautiful, user-friendly match report"""
+
+MATCH_REPORT_FORMAT_HEAD = """.
 
 **CRITICAL IMAGE INSTRUCTION:** 
 The listing data contains a **LISTING_IMAGE_URL:** field. You MUST extract the COMPLETE URL (do not truncate it) and insert it at the very top of your response using this EXACT format:
@@ -652,7 +779,9 @@ Make sure to copy the entire URL exactly as provided, including all characters a
 
 ---
 
-{image_gallery_section}
+"""
+
+MATCH_REPORT_FORMAT_TAIL = """
 
 ---
 
@@ -729,32 +858,69 @@ Good apartments in Zürich get many applications - send this today! ⚡
 
 Return ONLY the formatted match analysis, ready to display to the user."""
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+
+def build_match_report_messages(criteria: dict, listing_data: dict, image_analysis: str = "") -> List[dict]:
+    """Build the system and user messages for the match report prompt"""
+    # Determine if we have images to display
+    has_images = bool(image_analysis and image_analysis not in NO_IMAGE_ANALYSIS_RESULTS)
+    
+    # Debug: Check what we're receiving
+    logger.debug("image_analysis length: %d, has valid image analysis: %s", len(image_analysis or ""), has_images)
+    
+    image_analysis_section = f"## Image Analysis Results:\n{image_analysis}\n" if has_images else ""
+    image_gallery_section = MATCH_REPORT_GALLERY_SECTION if has_images else ""
+    with_images = " with photo gallery" if has_images else ""
+
+    # Build the user prompt
+    property_type_note = ""
+    if criteria.get('property_type'):
+        property_type_note = f"\n**IMPORTANT:** User is looking to {criteria.get('property_type')} (not {'buy' if criteria.get('property_type') == 'rent' else 'rent'}). Only recommend listings that match this property type."
+    
+    prompt = "".join([
+        "User's criteria:\n```json\n",
+        orjson.dumps(criteria, option=orjson.OPT_INDENT_2).decode(),
+        "\n```\n",
+        property_type_note,
+        "\n\nListing data:\n<listing>\n",
+        listing_data.get('content', ''),
+        "\n</listing>\n\n",
+        image_analysis_section,
+        MATCH_REPORT_TASK_HEADER,
+        with_images,
+        MATCH_REPORT_FORMAT_HEAD,
+        image_gallery_section,
+        MATCH_REPORT_FORMAT_TAIL,
+    ])
+
+    # Debug: Log the prompt being sent (first 1000 chars)
+    logger.debug("Prompt being sent to LLM (first 1000 chars):\n%.1000s", prompt)
+    
+    return [
+        {"role": "system", "content": MATCH_REPORT_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+async def generate_match_report(openai: httpx.AsyncClient, criteria: dict, listing_data: dict, image_analysis: str = "") -> str:
+    """Generate the final match report using OpenAI"""
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY not found in environment")
     
     payload = {
         "model": "gpt-4o-mini",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ],
+        "messages": build_match_report_messages(criteria, listing_data, image_analysis),
         "temperature": 0.1
     }
     
-    # Debug: Print the prompt being sent (first 1000 chars)
-    print(f"[Debug] Prompt being sent to LLM (first 1000 chars):\n{prompt[:1000]}")
-    
     try:
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            json=payload,
-            headers=headers,
+        response = await openai.post(
+            "/chat/completions",
+            content=orjson.dumps(payload),
             timeout=60
         )
         response.raise_for_status()
-        result = response.json()
+        result = orjson.loads(response.content)
         
         return result['choices'][0]['message']['content']
     
@@ -762,13 +928,59 @@ Return ONLY the formatted match analysis, ready to display to the user."""
         return f"Error generating match report: {str(e)}"
 
 
+async def stream_match_report(openai: httpx.AsyncClient, criteria: dict, listing_data: dict, image_analysis: str = "") -> AsyncIterator[str]:
+    """Stream the match report from OpenAI, yielding text chunks as they are generated"""
+    # Errors are yielded as report text: once streaming has started there is no
+    # way to turn them into an HTTP error status
+    try:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY not found in environment")
+        
+        payload = {
+            "model": "gpt-4o-mini",
+            "messages": build_match_report_messages(criteria, listing_data, image_analysis),
+            "temperature": 0.1,
+            "stream": True
+        }
+        
+        async with openai.stream(
+            "POST",
+            "/chat/completions",
+            content=orjson.dumps(payload),
+            timeout=60
+        ) as response:
+            response.raise_for_status()
+            # Server-sent events: one "data: {chunk}" line per delta, then "data: [DONE]"
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                data = line[len("data: "):]
+                if data == "[DONE]":
+                    break
+                choices = orjson.loads(data).get("choices")
+                delta = choices[0].get("delta", {}).get("content") if choices else None
+                if delta:
+                    yield delta
+    
+    except Exception as e:
+        yield f"Error generating match report: {str(e)}"
+
+
+async def report_event_stream(chunks: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    """Wrap report text chunks as server-sent events for the chat frontend"""
+    async for chunk in chunks:
+        yield b"data: " + orjson.dumps({"delta": chunk}) + b"\n\n"
+    yield b"data: [DONE]\n\n"
+
+
 # Authentication endpoints
 @app.post("/auth/register", response_model=AuthResponse)
 async def register(request: RegisterRequest):
     """Register a new user"""
     try:
         # Create user in Supabase Auth
-        auth_response = supabase.auth.sign_up({
+        auth_response = await run_in_threadpool(supabase.auth.sign_up, {
             "email": request.email,
             "password": request.password
         })
@@ -782,11 +994,11 @@ async def register(request: RegisterRequest):
         # Create access token
         access_token = create_access_token(data={"sub": user_id, "email": email})
         
-        return AuthResponse(
+        return ORJSONResponse(AuthResponse(
             access_token=access_token,
             user_id=user_id,
             email=email
-        )
+        ).model_dump())
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Registration failed: {str(e)}")
 
@@ -796,7 +1008,7 @@ async def login(request: LoginRequest):
     """Login user and return JWT token"""
     try:
         # Authenticate with Supabase
-        auth_response = supabase.auth.sign_in_with_password({
+        auth_response = await run_in_threadpool(supabase.auth.sign_in_with_password, {
             "email": request.email,
             "password": request.password
         })
@@ -810,11 +1022,11 @@ async def login(request: LoginRequest):
         # Create access token
         access_token = create_access_token(data={"sub": user_id, "email": email})
         
-        return AuthResponse(
+        return ORJSONResponse(AuthResponse(
             access_token=access_token,
             user_id=user_id,
             email=email
-        )
+        ).model_dump())
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Login failed: {str(e)}")
 
@@ -826,15 +1038,17 @@ async def get_user_criteria(user_id: str = Depends(verify_token)):
     try:
         logger.info(f"Fetching criteria for user_id: {user_id}")
         # Use service role client for backend operations (bypasses RLS since we verify JWT ourselves)
-        response = supabase_admin.table("user_criteria").select("*").eq("user_id", user_id).execute()
+        cached_criteria = await load_user_criteria(user_id)
         
-        if response.data and len(response.data) > 0:
-            criteria_data = response.data[0]
+        if cached_criteria:
+            # The cached row is shared, so strip fields from a copy
+            criteria_data = dict(cached_criteria)
             logger.info(f"Found criteria for user_id: {user_id}, data keys: {list(criteria_data.keys())}")
-            logger.debug(f"Criteria data: {criteria_data}")
+            logger.debug("Criteria data: %s", criteria_data)
             # Remove app_password from response for security
             criteria_data.pop('email_app_password', None)
-            return UserCriteriaResponse(**criteria_data)
+            # Rows come from our own table, so build the model without re-validating
+            return ORJSONResponse(UserCriteriaResponse.model_construct(**criteria_data).model_dump())
         else:
             logger.info(f"No criteria found for user_id: {user_id}")
             raise HTTPException(status_code=404, detail="No criteria found for user")
@@ -846,267 +1060,415 @@ async def get_user_criteria(user_id: str = Depends(verify_token)):
 
 
 # Email Monitoring Functions
+IMAP_SERVERS = MappingProxyType({
+    'gmail': 'imap.gmail.com',
+    'outlook': 'outlook.office365.com',
+    'yahoo': 'imap.mail.yahoo.com',
+    'icloud': 'imap.mail.me.com'
+})
+
+
+@lru_cache(maxsize=8)
 def get_imap_server(email_provider: str) -> str:
     """Get IMAP server address based on email provider"""
-    providers = {
-        'gmail': 'imap.gmail.com',
-        'outlook': 'outlook.office365.com',
-        'yahoo': 'imap.mail.yahoo.com',
-        'icloud': 'imap.mail.me.com'
-    }
-    return providers.get(email_provider.lower(), 'imap.gmail.com')
+    return IMAP_SERVERS.get(email_provider.lower(), 'imap.gmail.com')
 
 
 def extract_urls_from_email_body(body: str) -> List[str]:
     """Extract URLs from email body (HTML or plain text)"""
-    urls = []
-    
-    # Try parsing as HTML first
-    try:
-        soup = BeautifulSoup(body, 'html.parser')
-        # Find all links
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            if href and ('homegate.ch' in href.lower() or 'immoscout24.ch' in href.lower() or 'flatfox.ch' in href.lower()):
-                urls.append(href)
-    except Exception as e:
-        logging.debug(f"HTML parsing failed: {str(e)}")
-    
-    # Also search for URLs in plain text (more flexible pattern)
-    # Match URLs from property websites - handle URLs on separate lines
-    # Pattern matches URLs that may be on their own line or separated by whitespace
-    # Updated pattern to handle URLs that might be on separate lines with newlines
-    url_pattern = r'https?://[^\s<>"]*(?:homegate\.ch|immoscout24\.ch|flatfox\.ch)[^\s<>"]*'
-    found_urls = re.findall(url_pattern, body, re.IGNORECASE)
-    urls.extend(found_urls)
-    
-    # Handle URLs on separate lines (common in plain text emails)
-    # Split by lines and check each line for URLs
-    lines = body.split('\n')
-    for line in lines:
-        line = line.strip()
-        # Check if line contains a URL (not just starts with http, might have whitespace)
-        if 'http' in line.lower():
-            # Check if it's a property URL
-            if any(domain in line.lower() for domain in ['homegate.ch', 'immoscout24.ch', 'flatfox.ch']):
-                # Extract the full URL (might have leading/trailing whitespace or characters)
-                url_match = re.search(r'(https?://[^\s<>"]*(?:homegate\.ch|immoscout24\.ch|flatfox\.ch)[^\s<>"]*)', line, re.IGNORECASE)
-                if url_match:
-                    extracted_url = url_match.group(1).strip()
-                    urls.append(extracted_url)
-                    logging.debug(f"Found URL on line: {extracted_url}")
-    
-    # Also try a multiline pattern for URLs that might span or be separated
-    simple_pattern = r'https?://[^\s\n<>"]*(?:homegate\.ch|immoscout24\.ch|flatfox\.ch)[^\s\n<>"]*'
-    simple_urls = re.findall(simple_pattern, body, re.IGNORECASE | re.MULTILINE)
-    urls.extend(simple_urls)
-    
-    # Remove duplicates and clean URLs
-    unique_urls = []
-    seen = set()
-    for url in urls:
-        url = url.strip().rstrip('/')  # Remove trailing slash
-        if url and url not in seen:
-            # Validate it's a proper URL
-            if url.startswith('http://') or url.startswith('https://'):
-                unique_urls.append(url)
-                seen.add(url)
+    # Most emails link to no property site at all; plain substring search rules
+    # that out much faster than starting the regex engine
+    body_lower = body.lower()
+    if not any(domain in body_lower for domain in _PROPERTY_DOMAINS):
+        unique_urls = []
+    else:
+        # One pass over the raw body finds HTML href values and plain-text links alike;
+        # dict.fromkeys de-duplicates while keeping the order they appear in
+        # (links taken from HTML attributes still carry entities such as &amp;)
+        unique_urls = list(dict.fromkeys(
+            html.unescape(url).rstrip('/') for url in _PROPERTY_URL_RE.findall(body)
+        ))
     
     logging.info(f"Extracted {len(unique_urls)} unique URLs from email: {unique_urls}")
     if len(unique_urls) == 0:
-        logging.warning(f"No URLs extracted. Email body length: {len(body)} chars")
-        logging.debug(f"Email body preview (first 1000 chars): {body[:1000]}")
+        logging.warning("No URLs extracted. Email body length: %d chars", len(body))
+        logging.debug("Email body preview (first 1000 chars): %.1000s", body)
     return unique_urls
 
 
+# Email listings analyzed concurrently (each one scrapes and makes several OpenAI calls)
+MAX_CONCURRENT_ANALYSES = 5
+_analyze_semaphore = asyncio.Semaphore(MAX_CONCURRENT_ANALYSES)
+
+# Listing URLs or Message-IDs per processed_emails lookup, keeping the PostgREST GET URL well under server limits
+PROCESSED_URL_LOOKUP_BATCH_SIZE = 50
+
+
+# IMAP FETCH items: filter on a few headers first, download whole messages only for matches
+IMAP_HEADER_FETCH = '(BODY.PEEK[HEADER.FIELDS (SUBJECT FROM MESSAGE-ID DATE)])'
+IMAP_BODY_FETCH = '(BODY.PEEK[])'
+# Filter-stage headers never need MIME parsing (stateless, so safe to share across threads)
+_HEADER_PARSER = BytesHeaderParser()
+
+
+def parse_fetch_response(fetch_data: list) -> dict:
+    """Map each message sequence number in an IMAP FETCH response to its literal payload"""
+    payloads = {}
+    for item in fetch_data:
+        # Literals come back as (b'<id> (BODY[...] {size}', payload); closing b')' entries are skipped
+        if isinstance(item, tuple) and len(item) == 2:
+            payloads[item[0].split(None, 1)[0]] = item[1]
+    return payloads
+
+
+# Message ids per FETCH/STORE command, keeping the sequence set well under IMAP command-line limits
+IMAP_FETCH_BATCH_SIZE = 500
+_IMAP_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def fetch_in_batches(mail: imaplib.IMAP4_SSL, email_ids: list, message_parts: str) -> Optional[dict]:
+    """FETCH message ids in fixed-size batches and merge the payloads (None if the server rejects a batch)"""
+    payloads = {}
+    for start in range(0, len(email_ids), IMAP_FETCH_BATCH_SIZE):
+        status, fetch_data = mail.fetch(b','.join(email_ids[start:start + IMAP_FETCH_BATCH_SIZE]), message_parts)
+        if status != 'OK':
+            return None
+        payloads.update(parse_fetch_response(fetch_data))
+    return payloads
+
+
+def imap_since_date(last_email_check: Optional[str]) -> Optional[str]:
+    """IMAP SINCE date (DD-Mon-YYYY) covering every email received after the last check"""
+    if not last_email_check:
+        return None
+    try:
+        checked_at = datetime.fromisoformat(last_email_check)
+    except ValueError:
+        return None
+    # SINCE compares whole dates in the server's timezone, so start a day early to miss nothing
+    since = checked_at - timedelta(days=1)
+    return f"{since.day:02d}-{_IMAP_MONTHS[since.month - 1]}-{since.year}"
+
+
+# Socket timeout for IMAP connections: a pooled socket silently dropped by NAT or the provider raises
+# OSError (and is reconnected) instead of blocking until the kernel's TCP retransmission timeout
+IMAP_TIMEOUT_SECONDS = 30
+
+# Authenticated IMAP connections kept open between checks, keyed by (user_id, email_address, provider).
+# Each entry is (password_digest, connection) so a connection is only reused with the password it logged in with.
+_imap_pool: dict = {}
+_imap_locks: dict = {}
+_imap_locks_guard = threading.Lock()
+
+
+def get_imap_lock(key: tuple) -> threading.Lock:
+    """Lock serializing use of one pooled IMAP connection (imaplib is not thread-safe)"""
+    with _imap_locks_guard:
+        lock = _imap_locks.get(key)
+        if lock is None:
+            lock = _imap_locks[key] = threading.Lock()
+        return lock
+
+
+def discard_imap_connection(key: tuple) -> None:
+    """Drop a pooled IMAP connection, logging out if it is still alive"""
+    entry = _imap_pool.pop(key, None)
+    if entry is not None:
+        _, mail = entry
+        try:
+            mail.logout()
+        except Exception:
+            pass
+
+
+def get_imap_connection(key: tuple, email_address: str, app_password: str, email_provider: str) -> imaplib.IMAP4_SSL:
+    """Return a live pooled IMAP connection, reconnecting if the server dropped it or the password changed"""
+    password_digest = hashlib.sha256(app_password.encode()).digest()
+    entry = _imap_pool.get(key)
+    if entry is not None:
+        pooled_digest, mail = entry
+        if hmac.compare_digest(pooled_digest, password_digest):
+            try:
+                if mail.noop()[0] == 'OK':
+                    return mail
+            except (imaplib.IMAP4.error, OSError):
+                pass
+        discard_imap_connection(key)
+    
+    # Connect to IMAP server (login verifies the password before anything is pooled)
+    mail = imaplib.IMAP4_SSL(get_imap_server(email_provider), timeout=IMAP_TIMEOUT_SECONDS)
+    mail.login(email_address, app_password)
+    _imap_pool[key] = (password_digest, mail)
+    return mail
+
+
+def close_imap_pool() -> None:
+    """Log out of every pooled IMAP connection"""
+    for key in list(_imap_pool):
+        discard_imap_connection(key)
+
+
 def check_email_for_listings(
     email_address: str,
     app_password: str,
     email_provider: str,
     user_id: str,
     email_sender: Optional[str] = None,
-    email_subject_keywords: Optional[str] = None
-) -> List[dict]:
-    """Check email inbox for new emails matching configured filters"""
+    email_subject_keywords: Optional[str] = None,
+    since: Optional[str] = None
+) -> Optional[List[dict]]:
+    """Check email inbox for new emails matching configured filters (None if the check failed)"""
+    # Connections are never shared between users, even for the same mailbox
+    key = (user_id, email_address, email_provider)
     try:
-        # Connect to IMAP server
-        imap_server = get_imap_server(email_provider)
-        mail = imaplib.IMAP4_SSL(imap_server)
-        mail.login(email_address, app_password)
-        mail.select('INBOX')
-        
-        # Default values if not configured
-        sender_filter = email_sender.lower().strip() if email_sender else None
-        subject_keywords = [kw.strip().lower() for kw in email_subject_keywords.split(',')] if email_subject_keywords else ['match']
-        
-        # Handle multiple sender filters (comma-separated) - use OR logic
-        # IMAP doesn't support OR directly, so we'll search all unread and filter in code
-        search_criteria = ['UNSEEN']
-        sender_filters_list = []
-        if sender_filter:
-            # Split by comma if multiple senders provided
-            sender_filters_list = [s.strip() for s in sender_filter.split(',') if s.strip()]
-            logging.info(f"Sender filters configured: {sender_filters_list}")
-            # Note: IMAP FROM search only supports one sender at a time
-            # We'll search all UNSEEN emails and filter by sender in code
-            logging.info("Searching all unread emails, will filter by sender in code")
-        else:
-            logging.info("No sender filter configured, searching all unread emails")
-        
-        # Search for unread emails (we'll filter by sender and subject in code)
-        # Note: We search all UNSEEN emails because IMAP doesn't support OR for multiple senders
-        status, messages = mail.search(None, *search_criteria)
-        
-        if status != 'OK':
-            mail.close()
-            mail.logout()
-            return []
-        
-        email_ids = messages[0].split()
-        new_listings = []
-        
-        for email_id in email_ids:
+        with get_imap_lock(key):
             try:
-                # Fetch email
-                status, msg_data = mail.fetch(email_id, '(RFC822)')
-                if status != 'OK':
-                    continue
-                
-                email_body = msg_data[0][1]
-                email_message = email.message_from_bytes(email_body)
-                
-                # Get subject
-                subject_header = email_message['Subject']
-                if subject_header:
-                    subject_decoded = decode_header(subject_header)
-                    subject = subject_decoded[0][0] if subject_decoded else ''
-                    if isinstance(subject, bytes):
-                        subject = subject.decode('utf-8', errors='ignore')
-                    else:
-                        subject = str(subject) if subject else ''
+                mail = get_imap_connection(key, email_address, app_password, email_provider)
+                return search_inbox_for_listings(mail, user_id, email_sender, email_subject_keywords, since)
+            except (imaplib.IMAP4.abort, OSError) as e:
+                # Servers drop idle connections (~30 min for Gmail/iCloud); reconnect and retry once
+                logging.info(f"IMAP connection for {email_address} dropped ({str(e)}), reconnecting")
+                discard_imap_connection(key)
+                mail = get_imap_connection(key, email_address, app_password, email_provider)
+                return search_inbox_for_listings(mail, user_id, email_sender, email_subject_keywords, since)
+    except Exception as e:
+        logging.error(f"Error checking email: {str(e)}")
+        # The connection may be left mid-command; start fresh next time
+        with get_imap_lock(key):
+            discard_imap_connection(key)
+        return None
+
+
+def search_inbox_for_listings(
+    mail: imaplib.IMAP4_SSL,
+    user_id: str,
+    email_sender: Optional[str] = None,
+    email_subject_keywords: Optional[str] = None,
+    since: Optional[str] = None
+) -> List[dict]:
+    """Find unread emails on an open IMAP connection matching configured filters and extract their listing URLs"""
+    mail.select('INBOX')
+    
+    # Default values if not configured
+    sender_filter = email_sender.lower().strip() if email_sender else None
+    subject_keywords = [kw.strip().lower() for kw in email_subject_keywords.split(',')] if email_subject_keywords else ['match']
+    
+    # Handle multiple sender filters (comma-separated) - use OR logic
+    # IMAP doesn't support OR directly, so we'll search all unread and filter in code
+    search_criteria = ['UNSEEN']
+    # Emails rejected by the filters stay unread; only look at mail from around the last check onwards
+    if since:
+        search_criteria += ['SINCE', since]
+    sender_filters_list = []
+    if sender_filter:
+        # Split by comma if multiple senders provided
+        sender_filters_list = [s.strip() for s in sender_filter.split(',') if s.strip()]
+        logging.info(f"Sender filters configured: {sender_filters_list}")
+        # Note: IMAP FROM search only supports one sender at a time
+        # We'll search all UNSEEN emails and filter by sender in code
+        logging.info("Searching all unread emails, will filter by sender in code")
+    else:
+        logging.info("No sender filter configured, searching all unread emails")
+    
+    # Search for unread emails (we'll filter by sender and subject in code)
+    # Note: We search all UNSEEN emails because IMAP doesn't support OR for multiple senders
+    status, messages = mail.search(None, *search_criteria)
+    
+    if status != 'OK':
+        mail.close()
+        return []
+    
+    email_ids = messages[0].split()
+    new_listings = []
+    if not email_ids:
+        mail.close()
+        return []
+    
+    # Fetch only the headers needed for filtering, a batch of unread emails per round-trip.
+    # PEEK leaves the \Seen flag alone, so skipped emails stay unread.
+    headers_by_id = fetch_in_batches(mail, email_ids, IMAP_HEADER_FETCH)
+    if headers_by_id is None:
+        mail.close()
+        return []
+    
+    candidates = []
+    for email_id in email_ids:
+        try:
+            header_bytes = headers_by_id.get(email_id)
+            if header_bytes is None:
+                continue
+            email_message = _HEADER_PARSER.parsebytes(header_bytes)
+            
+            # Get subject
+            subject_header = email_message['Subject']
+            if subject_header:
+                subject_decoded = decode_header(subject_header)
+                subject = subject_decoded[0][0] if subject_decoded else ''
+                if isinstance(subject, bytes):
+                    subject = subject.decode('utf-8', errors='ignore')
                 else:
-                    subject = ''
-                
-                # Get sender email address for filtering
-                sender_address = email_message['From'] or ''
-                sender_lower = sender_address.lower()
-                
-                # Filter by sender if configured (check if any sender filter matches)
-                if sender_filters_list:
-                    sender_matches = False
-                    for filter_sender in sender_filters_list:
-                        # Check if filter matches sender email or domain
-                        # e.g., "homegate" matches "noreply@homegate.ch" or "homegate.ch"
-                        # e.g., "gilda.fernandezconcha@gmail.com" matches exact email
-                        if filter_sender in sender_lower:
-                            sender_matches = True
-                            logging.debug(f"Sender filter '{filter_sender}' matches '{sender_address}'")
-                            break
-                    
-                    if not sender_matches:
-                        logging.debug(f"Skipping email - sender '{sender_address}' doesn't match any filter: {sender_filters_list}")
-                        continue
-                
-                # Filter: only process emails with configured keywords in subject (case-insensitive)
-                subject_lower = subject.lower()
-                if not any(keyword in subject_lower for keyword in subject_keywords):
-                    logging.debug(f"Skipping email - subject '{subject}' doesn't contain any of the keywords: {subject_keywords}")
-                    continue
-                
-                logging.info(f"Processing email: Subject='{subject}', From='{sender_address}'")
-                
-                # Get message ID
-                message_id = email_message['Message-ID'] or f"{email_id.decode()}"
+                    subject = str(subject) if subject else ''
+            else:
+                subject = ''
+            
+            # Get sender email address for filtering
+            sender_address = email_message['From'] or ''
+            sender_lower = sender_address.lower()
+            
+            # Filter by sender if configured (check if any sender filter matches)
+            if sender_filters_list:
+                sender_matches = False
+                for filter_sender in sender_filters_list:
+                    # Check if filter matches sender email or domain
+                    # e.g., "homegate" matches "noreply@homegate.ch" or "homegate.ch"
+                    # e.g., "gilda.fernandezconcha@gmail.com" matches exact email
+                    if filter_sender in sender_lower:
+                        sender_matches = True
+                        logging.debug(f"Sender filter '{filter_sender}' matches '{sender_address}'")
+                        break
                 
-                # Check if already processed (by message_id)
-                processed = supabase_admin.table("processed_emails").select("*").eq("user_id", user_id).eq("email_message_id", message_id).execute()
-                if processed.data and len(processed.data) > 0:
-                    logging.info(f"Email '{subject}' (message_id: {message_id}) already processed, skipping")
+                if not sender_matches:
+                    logging.debug(f"Skipping email - sender '{sender_address}' doesn't match any filter: {sender_filters_list}")
                     continue
-                
-                # Extract body - prioritize plain text, fallback to HTML
-                body = ""
-                plain_text_body = ""
-                html_body = ""
-                
-                if email_message.is_multipart():
-                    for part in email_message.walk():
-                        content_type = part.get_content_type()
-                        if content_type == "text/plain":
-                            try:
-                                payload = part.get_payload(decode=True)
-                                if payload:
-                                    plain_text_body += payload.decode('utf-8', errors='ignore')
-                            except Exception as e:
-                                logging.debug(f"Error decoding plain text part: {e}")
-                        elif content_type == "text/html":
-                            try:
-                                payload = part.get_payload(decode=True)
-                                if payload:
-                                    html_body += payload.decode('utf-8', errors='ignore')
-                            except Exception as e:
-                                logging.debug(f"Error decoding HTML part: {e}")
-                else:
-                    try:
-                        body = email_message.get_payload(decode=True).decode('utf-8', errors='ignore')
-                    except:
-                        body = str(email_message.get_payload())
-                
-                # Use plain text if available, otherwise HTML
-                if plain_text_body:
-                    body = plain_text_body
-                    logging.debug(f"Using plain text body (length: {len(body)} chars)")
-                elif html_body:
-                    body = html_body
-                    logging.debug(f"Using HTML body (length: {len(body)} chars)")
-                elif body:
-                    logging.debug(f"Using single-part body (length: {len(body)} chars)")
-                
-                # Extract URLs
-                logging.info(f"Extracting URLs from email body (length: {len(body)} chars)")
-                # Log email body for debugging (first 2000 chars)
-                logging.info(f"Email body preview (first 2000 chars):\n{body[:2000]}")
-                urls = extract_urls_from_email_body(body)
-                logging.info(f"✓ Found {len(urls)} URLs in email '{subject}': {urls}")
-                
-                # If fewer URLs than expected, log warning
-                if len(urls) == 0:
-                    logging.error(f"✗ No URLs extracted from email '{subject}'. Full body:\n{body}")
-                elif len(urls) < 3:
-                    logging.warning(f"⚠ Only {len(urls)} URL(s) extracted, might be missing some. Full body:\n{body}")
-                
-                # Log email body snippet for debugging if URLs seem incomplete
-                if len(urls) > 0 and len(urls) < 3:
-                    logging.warning(f"⚠ Only {len(urls)} URL(s) found, expected more. Email body preview (first 2000 chars):\n{body[:2000]}")
-                elif not urls:
-                    logging.warning(f"⚠ No URLs found in email '{subject}'. Email body preview (first 2000 chars):\n{body[:2000]}")
-                
-                # Log email body snippet for debugging (first 500 chars)
-                if not urls:
-                    logging.warning(f"No URLs found. Email body preview (first 500 chars): {body[:500]}")
-                
-                if urls:
-                    new_listings.append({
-                        'message_id': message_id,
-                        'subject': subject,
-                        'from': email_message['From'],
-                        'urls': urls,
-                        'received_date': email_message['Date']
-                    })
-                else:
-                    logging.warning(f"No property URLs found in email. Email body length: {len(body)}")
-                    
-            except Exception as e:
-                logging.error(f"Error processing email {email_id}: {str(e)}")
+            
+            # Filter: only process emails with configured keywords in subject (case-insensitive)
+            subject_lower = subject.lower()
+            if not any(keyword in subject_lower for keyword in subject_keywords):
+                logging.debug(f"Skipping email - subject '{subject}' doesn't contain any of the keywords: {subject_keywords}")
                 continue
-        
+            
+            # Get message ID
+            message_id = email_message['Message-ID'] or f"{email_id.decode()}"
+            
+            candidates.append({
+                'email_id': email_id,
+                'message_id': message_id,
+                'subject': subject,
+                'from': email_message['From'],
+                'received_date': email_message['Date']
+            })
+                
+        except Exception as e:
+            logging.error(f"Error processing email {email_id}: {str(e)}")
+            continue
+    
+    # Check which candidates were already processed (by message_id), a fixed-size chunk per query
+    # so a large unread backlog can't exceed the request URL length
+    if candidates:
+        message_ids = [candidate['message_id'] for candidate in candidates]
+        processed_ids = set()
+        for start in range(0, len(message_ids), PROCESSED_URL_LOOKUP_BATCH_SIZE):
+            processed = supabase_admin.table("processed_emails").select("email_message_id").eq("user_id", user_id).in_(
+                "email_message_id", message_ids[start:start + PROCESSED_URL_LOOKUP_BATCH_SIZE]
+            ).execute()
+            processed_ids.update(row['email_message_id'] for row in processed.data or [])
+        if processed_ids:
+            for candidate in candidates:
+                if candidate['message_id'] in processed_ids:
+                    logging.info(f"Email '{candidate['subject']}' (message_id: {candidate['message_id']}) already processed, skipping")
+            candidates = [candidate for candidate in candidates if candidate['message_id'] not in processed_ids]
+    
+    if not candidates:
+        mail.close()
+        return []
+    
+    # Download full messages only for the emails that passed the filters
+    candidate_ids = [candidate['email_id'] for candidate in candidates]
+    bodies_by_id = fetch_in_batches(mail, candidate_ids, IMAP_BODY_FETCH)
+    if bodies_by_id is None:
         mail.close()
-        mail.logout()
-        return new_listings
-        
-    except Exception as e:
-        logging.error(f"Error checking email: {str(e)}")
         return []
+    
+    for candidate in candidates:
+        email_id = candidate['email_id']
+        subject = candidate['subject']
+        try:
+            email_body = bodies_by_id.get(email_id)
+            if email_body is None:
+                continue
+            email_message = email.message_from_bytes(email_body)
+            
+            logging.info(f"Processing email: Subject='{subject}', From='{candidate['from']}'")
+            
+            # Extract body - prioritize plain text, fallback to HTML
+            body = ""
+            plain_text_body = ""
+            html_body = ""
+            
+            if email_message.is_multipart():
+                # Collect decoded parts and join once instead of repeated string concatenation
+                plain_parts = []
+                html_parts = []
+                for part in email_message.walk():
+                    content_type = part.get_content_type()
+                    if content_type == "text/plain":
+                        try:
+                            payload = part.get_payload(decode=True)
+                            if payload:
+                                plain_parts.append(payload.decode('utf-8', errors='ignore'))
+                        except Exception as e:
+                            logging.debug(f"Error decoding plain text part: {e}")
+                    elif content_type == "text/html":
+                        try:
+                            payload = part.get_payload(decode=True)
+                            if payload:
+                                html_parts.append(payload.decode('utf-8', errors='ignore'))
+                        except Exception as e:
+                            logging.debug(f"Error decoding HTML part: {e}")
+                plain_text_body = ''.join(plain_parts)
+                html_body = ''.join(html_parts)
+            else:
+                try:
+                    body = email_message.get_payload(decode=True).decode('utf-8', errors='ignore')
+                except:
+                    body = str(email_message.get_payload())
+            
+            # Use plain text if available, otherwise HTML
+            if plain_text_body:
+                body = plain_text_body
+                logging.debug(f"Using plain text body (length: {len(body)} chars)")
+            elif html_body:
+                body = html_body
+                logging.debug(f"Using HTML body (length: {len(body)} chars)")
+            elif body:
+                logging.debug(f"Using single-part body (length: {len(body)} chars)")
+            
+            # Extract URLs (bodies can be large, so they are only formatted when debug logging is on)
+            logging.info("Extracting URLs from email body (length: %d chars)", len(body))
+            logging.debug("Email body preview (first 2000 chars):\n%.2000s", body)
+            urls = extract_urls_from_email_body(body)
+            logging.info("✓ Found %d URLs in email '%s': %s", len(urls), subject, urls)
+            
+            # If fewer URLs than expected, log warning
+            if len(urls) == 0:
+                logging.error("✗ No URLs extracted from email '%s'", subject)
+                logging.debug("Full body:\n%s", body)
+            elif len(urls) < 3:
+                logging.warning("⚠ Only %d URL(s) extracted, might be missing some", len(urls))
+                logging.debug("Full body:\n%s", body)
+            
+            if urls:
+                new_listings.append({
+                    'message_id': candidate['message_id'],
+                    'subject': subject,
+                    'from': candidate['from'],
+                    'urls': urls,
+                    'received_date': candidate['received_date']
+                })
+            else:
+                logging.warning("No property URLs found in email. Email body length: %d", len(body))
+                
+        except Exception as e:
+            logging.error(f"Error processing email {email_id}: {str(e)}")
+            continue
+    
+    # Mark the downloaded emails as read now that they have been processed
+    for start in range(0, len(candidate_ids), IMAP_FETCH_BATCH_SIZE):
+        mail.store(b','.join(candidate_ids[start:start + IMAP_FETCH_BATCH_SIZE]), '+FLAGS', '\\Seen')
+    
+    # Only deselect the mailbox; the connection stays in the pool for the next check
+    mail.close()
+    return new_listings
 
 
 async def process_new_email_listings(user_id: str, email_address: str, app_password: str, email_provider: str, email_sender: Optional[str] = None, email_subject_keywords: Optional[str] = None):
@@ -1115,23 +1477,43 @@ async def process_new_email_listings(user_id: str, email_address: str, app_passw
         logging.info(f"Starting email check for user {user_id}")
         logging.info(f"Filters - Sender: {email_sender}, Subject keywords: {email_subject_keywords}")
         
-        # Check for new emails with configured filters
-        new_listings = check_email_for_listings(email_address, app_password, email_provider, user_id, email_sender, email_subject_keywords)
+        # Get user criteria
+        user_criteria = await load_user_criteria(user_id)
+        if not user_criteria:
+            return
+        
+        # Check for new emails with configured filters (blocking IMAP I/O runs in the threadpool)
+        checked_at = datetime.now(timezone.utc)
+        new_listings = await run_in_threadpool(
+            check_email_for_listings, email_address, app_password, email_provider, user_id, email_sender, email_subject_keywords,
+            imap_since_date(user_criteria.get('last_email_check'))
+        )
+        if new_listings is None:
+            # Keep last_email_check so the next search window still covers this one
+            return
         
         logging.info(f"Found {len(new_listings)} new listings to process")
         
         if not new_listings:
             logging.info("No new listings found")
+            await record_email_check(user_id, checked_at)
             return
         
-        # Get user criteria
-        criteria_response = supabase_admin.table("user_criteria").select("*").eq("user_id", user_id).execute()
-        if not criteria_response.data or len(criteria_response.data) == 0:
-            return
-        
-        user_criteria = criteria_response.data[0]
+        # Look up which URLs from this batch were already recorded (avoid duplicates), a fixed-size
+        # chunk per query so a large batch can't exceed the request URL length
+        all_urls = list(dict.fromkeys(url for listing in new_listings for url in listing['urls']))
+        existing_by_url = {}
+        for start in range(0, len(all_urls), PROCESSED_URL_LOOKUP_BATCH_SIZE):
+            existing = await run_in_threadpool(
+                supabase_admin.table("processed_emails").select("listing_url, analysis_result").eq("user_id", user_id).in_(
+                    "listing_url", all_urls[start:start + PROCESSED_URL_LOOKUP_BATCH_SIZE]
+                ).execute
+            )
+            existing_by_url.update((row['listing_url'], row) for row in existing.data or [])
         
         # Process each listing
+        analyses = []
+        new_rows = []
         logging.info(f"Found {len(new_listings)} emails with listings to process")
         for listing in new_listings:
             urls_count = len(listing['urls'])
@@ -1142,10 +1524,9 @@ async def process_new_email_listings(user_id: str, email_address: str, app_passw
                     logging.info(f"[{idx}/{urls_count}] Processing URL: {url}")
                     
                     # Check if already exists (avoid duplicates)
-                    existing = supabase_admin.table("processed_emails").select("*").eq("user_id", user_id).eq("listing_url", url).execute()
+                    existing_record = existing_by_url.get(url)
                     
-                    if existing.data and len(existing.data) > 0:
-                        existing_record = existing.data[0]
+                    if existing_record:
                         # Check if analysis already exists
                         if existing_record.get('analysis_result'):
                             logging.info(f"URL {url} already has analysis, skipping")
@@ -1153,23 +1534,25 @@ async def process_new_email_listings(user_id: str, email_address: str, app_passw
                         else:
                             logging.info(f"URL {url} exists but no analysis yet, will retry analysis")
                     
-                    # Mark email as processed (insert or update)
-                    if not existing.data or len(existing.data) == 0:
-                        supabase_admin.table("processed_emails").insert({
+                    # Mark email as processed (rows for new URLs are inserted together below)
+                    if not existing_record:
+                        row = {
                             'user_id': user_id,
                             'email_message_id': listing['message_id'],
                             'email_subject': listing['subject'],
                             'email_from': listing['from'],
                             'listing_url': url,
                             'analysis_result': None  # Will be updated after analysis
-                        }).execute()
-                        logging.info(f"✓ Inserted processed_email record for URL {idx}/{urls_count}: {url}")
+                        }
+                        new_rows.append(row)
+                        existing_by_url[url] = row
+                        logging.info(f"✓ Queued processed_email record for URL {idx}/{urls_count}: {url}")
                     else:
                         logging.info(f"✓ Record already exists for URL {idx}/{urls_count}: {url}")
                     
-                    # Trigger analysis (async) - use asyncio.create_task to run in background
-                    asyncio.create_task(analyze_listing_from_email(user_id, url, user_criteria))
-                    logging.info(f"✓ Started analysis task {idx}/{urls_count} for: {url}")
+                    # Queue analysis; they run concurrently (bounded) once all URLs are recorded
+                    analyses.append(analyze_listing_bounded(user_id, url, user_criteria))
+                    logging.info(f"✓ Queued analysis {idx}/{urls_count} for: {url}")
                     
                 except Exception as e:
                     logging.error(f"✗ Error processing URL {idx}/{urls_count} ({url}): {str(e)}", exc_info=True)
@@ -1177,28 +1560,55 @@ async def process_new_email_listings(user_id: str, email_address: str, app_passw
             
             logging.info(f"✓ Completed processing all {urls_count} URLs from email '{listing['subject']}'")
         
-        # Update last_email_check timestamp
-        supabase_admin.table("user_criteria").update({
-            'last_email_check': datetime.utcnow().isoformat()
-        }).eq("user_id", user_id).execute()
+        # Record all new URLs in one request before any analysis tries to update its row
+        if new_rows:
+            await run_in_threadpool(
+                supabase_admin.table("processed_emails").upsert(
+                    new_rows, on_conflict="user_id,listing_url", ignore_duplicates=True
+                ).execute
+            )
+            logging.info(f"✓ Inserted {len(new_rows)} processed_email records")
+        
+        # Wait for the analyses so last_email_check reflects completed work
+        await asyncio.gather(*analyses, return_exceptions=True)
+        
+        await record_email_check(user_id, checked_at)
         
     except Exception as e:
         logging.error(f"Error in process_new_email_listings: {str(e)}")
 
 
+async def record_email_check(user_id: str, checked_at: datetime):
+    """Store when the user's inbox was last searched; the next check only looks at mail since then"""
+    await run_in_threadpool(
+        supabase_admin.table("user_criteria").update({
+            'last_email_check': checked_at.isoformat()
+        }).eq("user_id", user_id).execute
+    )
+    invalidate_user_criteria(user_id)
+
+
+async def analyze_listing_bounded(user_id: str, listing_url: str, user_criteria: dict):
+    """Analyze a listing while capping how many scrapes and LLM calls run at once"""
+    async with _analyze_semaphore:
+        await analyze_listing_from_email(user_id, listing_url, user_criteria)
+
+
 async def analyze_listing_from_email(user_id: str, listing_url: str, user_criteria: dict):
     """Analyze a listing URL from email and store results"""
     try:
         logging.info(f"Starting analysis for URL: {listing_url}")
         
         # Scrape listing
-        listing_data = call_firecrawl_scraper(listing_url)
+        listing_data = await call_firecrawl_scraper(app.state.http, listing_url)
         if "error" in listing_data:
             logging.error(f"Error scraping listing {listing_url}: {listing_data.get('error')}")
             # Store error in database
-            supabase_admin.table("processed_emails").update({
-                'analysis_result': {'error': listing_data.get('error'), 'url': listing_url}
-            }).eq("user_id", user_id).eq("listing_url", listing_url).execute()
+            await run_in_threadpool(
+                supabase_admin.table("processed_emails").update({
+                    'analysis_result': {'error': listing_data.get('error'), 'url': listing_url}
+                }).eq("user_id", user_id).eq("listing_url", listing_url).execute
+            )
             return
         
         logging.info(f"Successfully scraped listing, generating report...")
@@ -1207,10 +1617,10 @@ async def analyze_listing_from_email(user_id: str, listing_url: str, user_criter
         criteria_text = json.dumps(user_criteria, default=str)
         
         # Analyze images
-        image_analysis = analyze_images(listing_data.get('content', ''), max_images=3)
+        image_analysis = await analyze_images(app.state.openai, listing_data.get('images', []), max_images=3)
         
         # Generate match report
-        match_report = generate_match_report(user_criteria, listing_data, image_analysis)
+        match_report = await generate_match_report(app.state.openai, user_criteria, listing_data, image_analysis)
         
         logging.info(f"Generated match report (length: {len(match_report)}), storing in database...")
         
@@ -1218,28 +1628,30 @@ async def analyze_listing_from_email(user_id: str, listing_url: str, user_criter
         analysis_data = {
             'report': match_report,
             'url': listing_url,
-            'analyzed_at': datetime.utcnow().isoformat()
+            'analyzed_at': datetime.now(timezone.utc).isoformat()
         }
         
         # Update the analysis_result field - use supabase_admin to bypass RLS
+        # (queries run in the threadpool so concurrent email checks don't block the event loop)
+        update_query = supabase_admin.table("processed_emails").update({
+            'analysis_result': analysis_data
+        }).eq("user_id", user_id).eq("listing_url", listing_url)
         try:
-            update_result = supabase_admin.table("processed_emails").update({
-                'analysis_result': analysis_data
-            }).eq("user_id", user_id).eq("listing_url", listing_url).execute()
+            update_result = await run_in_threadpool(update_query.execute)
             
             if update_result.data and len(update_result.data) > 0:
                 logging.info(f"Successfully stored analysis result for {listing_url}")
             else:
                 logging.warning(f"No rows updated for {listing_url}, record might not exist")
                 # Try to ensure the record exists by checking first
-                check = supabase_admin.table("processed_emails").select("*").eq("user_id", user_id).eq("listing_url", listing_url).execute()
+                check = await run_in_threadpool(
+                    supabase_admin.table("processed_emails").select("id").eq("user_id", user_id).eq("listing_url", listing_url).execute
+                )
                 if not check.data or len(check.data) == 0:
                     logging.error(f"Record doesn't exist for {listing_url}, cannot store analysis")
                 else:
                     logging.info(f"Record exists, retrying update...")
-                    update_result = supabase_admin.table("processed_emails").update({
-                        'analysis_result': analysis_data
-                    }).eq("user_id", user_id).eq("listing_url", listing_url).execute()
+                    update_result = await run_in_threadpool(update_query.execute)
                     if update_result.data:
                         logging.info(f"Successfully stored analysis result on retry for {listing_url}")
         except Exception as db_error:
@@ -1250,16 +1662,11 @@ async def analyze_listing_from_email(user_id: str, listing_url: str, user_criter
         logging.error(f"Error analyzing listing from email: {str(e)}", exc_info=True)
         # Try to store error in database
         try:
-            supabase_admin.table("processed_emails").update({
-                'analysis_result': {'error': str(e), 'url': listing_url}
-            }).eq("user_id", user_id).eq("listing_url", listing_url).execute()
-        except:
-            pass
-        # Try to store error in database
-        try:
-            supabase_admin.table("processed_emails").update({
-                'analysis_result': {'error': str(e), 'url': listing_url}
-            }).eq("user_id", user_id).eq("listing_url", listing_url).execute()
+            await run_in_threadpool(
+                supabase_admin.table("processed_emails").update({
+                    'analysis_result': {'error': str(e), 'url': listing_url}
+                }).eq("user_id", user_id).eq("listing_url", listing_url).execute
+            )
         except:
             pass
 
@@ -1275,7 +1682,7 @@ async def create_user_criteria(
         # Check if criteria already exists
         existing = supabase_admin.table("user_criteria").select("*").eq("user_id", user_id).execute()
         
-        criteria_data = criteria.dict(exclude_none=True)
+        criteria_data = criteria.model_dump(exclude_none=True)
         criteria_data["user_id"] = user_id
         
         # Handle app_password: only update if provided, otherwise keep existing
@@ -1284,25 +1691,25 @@ async def create_user_criteria(
         if existing.data and len(existing.data) > 0:
             # Update existing
             criteria_id = existing.data[0]["id"]
-            criteria_data["updated_at"] = datetime.utcnow().isoformat()
             # Only update password if a new one is provided
             if app_password:
                 criteria_data["email_app_password"] = app_password
             # If app_password is None, don't include it - this preserves the existing password
             response = supabase_admin.table("user_criteria").update(criteria_data).eq("id", criteria_id).execute()
         else:
-            # Create new
-            criteria_data["created_at"] = datetime.utcnow().isoformat()
-            criteria_data["updated_at"] = datetime.utcnow().isoformat()
+            # Create new (created_at/updated_at come from column defaults and the update trigger)
             if app_password:
                 criteria_data["email_app_password"] = app_password
             response = supabase_admin.table("user_criteria").insert(criteria_data).execute()
+        invalidate_user_criteria(user_id)
+        # Monitoring settings may have changed
+        _monitored_users_cache.clear()
         
         if response.data and len(response.data) > 0:
             result = response.data[0].copy()
             # Remove app_password from response for security
             result.pop('email_app_password', None)
-            return UserCriteriaResponse(**result)
+            return ORJSONResponse(UserCriteriaResponse.model_construct(**result).model_dump())
         else:
             raise HTTPException(status_code=500, detail="Failed to save criteria")
     except HTTPException:
@@ -1318,8 +1725,7 @@ async def update_user_criteria(
 ):
     """Update user criteria"""
     try:
-        criteria_data = criteria.dict(exclude_none=True)
-        criteria_data["updated_at"] = datetime.utcnow().isoformat()
+        criteria_data = criteria.model_dump(exclude_none=True)
         
         # Handle app_password separately
         app_password = criteria_data.pop('email_app_password', None)
@@ -1327,12 +1733,15 @@ async def update_user_criteria(
             criteria_data["email_app_password"] = app_password
         
         response = supabase_admin.table("user_criteria").update(criteria_data).eq("user_id", user_id).execute()
+        invalidate_user_criteria(user_id)
+        # Monitoring settings may have changed
+        _monitored_users_cache.clear()
         
         if response.data and len(response.data) > 0:
             result = response.data[0].copy()
             # Remove app_password from response for security
             result.pop('email_app_password', None)
-            return UserCriteriaResponse(**result)
+            return ORJSONResponse(UserCriteriaResponse.model_construct(**result).model_dump())
         else:
             raise HTTPException(status_code=404, detail="No criteria found to update")
     except HTTPException:
@@ -1349,13 +1758,11 @@ async def check_email_manual(
     """Manually trigger email check"""
     try:
         # Get user criteria with email settings
-        criteria_response = supabase_admin.table("user_criteria").select("*").eq("user_id", user_id).execute()
+        user_criteria = await load_user_criteria(user_id)
         
-        if not criteria_response.data or len(criteria_response.data) == 0:
+        if not user_criteria:
             raise HTTPException(status_code=404, detail="No criteria found")
         
-        user_criteria = criteria_response.data[0]
-        
         if not user_criteria.get('email_monitoring_enabled'):
             raise HTTPException(status_code=400, detail="Email monitoring is not enabled")
         
@@ -1379,14 +1786,16 @@ async def check_email_manual(
         
         # Check for pending analyses and retry them
         try:
-            pending_analyses = supabase_admin.table("processed_emails").select("*").eq("user_id", user_id).is_("analysis_result", "null").execute()
+            pending_analyses = await run_in_threadpool(
+                supabase_admin.table("processed_emails").select("*").eq("user_id", user_id).is_("analysis_result", "null").execute
+            )
             if pending_analyses.data and len(pending_analyses.data) > 0:
                 logger.info(f"Found {len(pending_analyses.data)} pending analyses, retrying...")
                 for pending in pending_analyses.data:
                     listing_url = pending.get('listing_url')
                     if listing_url:
                         logger.info(f"Retrying analysis for {listing_url}")
-                        asyncio.create_task(analyze_listing_from_email(user_id, listing_url, user_criteria))
+                        asyncio.create_task(analyze_listing_bounded(user_id, listing_url, user_criteria))
         except Exception as e:
             logger.warning(f"Error checking for pending analyses: {str(e)}")
         
@@ -1408,131 +1817,240 @@ async def check_email_manual(
         raise HTTPException(status_code=500, detail=f"Error checking email: {str(e)}")
 
 
+# Columns the analyses endpoint reads from processed_emails, aliased to the response keys so rows
+# can be returned as-is (processed_at is exposed as created_at)
+ANALYSES_BASE_COLUMNS = "id,listing_url,email_subject,email_from,created_at:processed_at"
+ANALYSES_COMPLETED_COLUMNS = f"{ANALYSES_BASE_COLUMNS},report:analysis_result->>report,url:analysis_result->>url"
+ANALYSES_PENDING_COLUMNS = f"{ANALYSES_BASE_COLUMNS},error:analysis_result->>error"
+
+
+def parse_analyses_cursor(cursor: str) -> tuple[str, str]:
+    """Split a "processed_at|id" analyses cursor, rejecting anything that is not a timestamp and a UUID"""
+    cursor_processed_at, separator, cursor_id = cursor.rpartition('|')
+    try:
+        if not separator:
+            raise ValueError(cursor)
+        # Re-serialize both parts so only well-formed values reach the PostgREST filter
+        return datetime.fromisoformat(cursor_processed_at).isoformat(), str(uuid.UUID(cursor_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# Database error substrings mapped to friendlier messages, checked in order
+ANALYSES_ERROR_RULES = (
+    (("does not exist", "relation", "table"),
+     "The processed_emails table does not exist. Please run the database migration: supabase_schema_email.sql in your Supabase SQL Editor."),
+    (("permission", "policy", "row level security"),
+     "Permission denied. Please ensure Row Level Security policies are set up correctly for the processed_emails table."),
+)
+
+
 @app.get("/api/user/analyses")
 async def get_email_analyses(
     user_id: str = Depends(verify_token),
-    limit: int = 50
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    pending_limit: int = Query(25, ge=1, le=200)
 ):
-    """Get email analysis results for the user"""
+    """Get email analysis results for the user, newest first (pass next_cursor back as cursor for the next page)"""
+    cursor_position = parse_analyses_cursor(cursor) if cursor else None
     try:
         # Use service role client for backend operations (bypasses RLS since we verify JWT ourselves)
-        # Get all processed emails with analysis results for this user
-        # Note: Column is 'processed_at' not 'created_at'
-        # Try ordering by processed_at descending
-        try:
-            response = supabase_admin.table("processed_emails").select("*").eq("user_id", user_id).order("processed_at", desc=True).limit(limit).execute()
-        except Exception as order_error:
-            # If ordering fails, try without order or with different syntax
-            logging.warning(f"Ordering failed, trying without order: {str(order_error)}")
-            response = supabase_admin.table("processed_emails").select("*").eq("user_id", user_id).limit(limit).execute()
+        # Completed and pending/errored rows come from two narrow queries run concurrently; each
+        # filter matches a partial index (supabase_schema_processed_emails_indexes.sql).
+        # Newest first (column is 'processed_at', not 'created_at').
+        completed_query = (
+            supabase_admin.table("processed_emails").select(ANALYSES_COMPLETED_COLUMNS).eq("user_id", user_id)
+            .not_.is_("analysis_result->report", "null").is_("analysis_result->error", "null")
+        )
+        # Keyset pagination: continue strictly after the last row of the previous page. Rows written
+        # in one batch share processed_at, so the id breaks ties.
+        if cursor_position:
+            cursor_processed_at, cursor_id = cursor_position
+            completed_query = completed_query.or_(
+                f'processed_at.lt."{cursor_processed_at}",'
+                f'and(processed_at.eq."{cursor_processed_at}",id.lt.{cursor_id})'
+            )
+        completed_query = completed_query.order("processed_at", desc=True).order("id", desc=True).limit(limit)
+        # Pending and failed analyses are transient, so only the newest are listed (not paginated);
+        # the exact count covers all of them
+        pending_query = (
+            supabase_admin.table("processed_emails").select(ANALYSES_PENDING_COLUMNS, count="exact")
+            .eq("user_id", user_id)
+            .or_("analysis_result.is.null,analysis_result->error.not.is.null")
+            .order("processed_at", desc=True).limit(pending_limit)
+        )
+        completed, pending = await asyncio.gather(
+            run_in_threadpool(completed_query.execute),
+            run_in_threadpool(pending_query.execute)
+        )
         
-        analyses = []
-        pending_analyses = []
-        if response.data:
-            logging.info(f"Found {len(response.data)} processed email records")
-            for item in response.data:
-                analysis_result = item.get('analysis_result')
-                listing_url = item.get('listing_url')
-                
-                # Track pending analyses (record exists but no analysis_result yet)
-                if not analysis_result:
-                    pending_analyses.append({
-                        'id': str(item.get('id')),
-                        'listing_url': listing_url,
-                        'email_subject': item.get('email_subject') or 'No subject',
-                        'email_from': item.get('email_from') or 'Unknown',
-                        'created_at': item.get('processed_at') or item.get('created_at'),
-                        'status': 'pending'
-                    })
-                    logging.debug(f"Analysis pending for {listing_url}")
-                    continue
-                
-                # Handle both dict and string formats for analysis_result
-                if isinstance(analysis_result, str):
-                    try:
-                        analysis_result = json.loads(analysis_result)
-                    except json.JSONDecodeError:
-                        logging.warning(f"Failed to parse analysis_result as JSON: {str(analysis_result)[:100]}")
-                        analysis_result = {}
-                elif not isinstance(analysis_result, dict):
-                    analysis_result = {}
-                
-                # Check for errors
-                if analysis_result.get('error'):
-                    logging.warning(f"Analysis error for {listing_url}: {analysis_result.get('error')}")
-                    pending_analyses.append({
-                        'id': str(item.get('id')),
-                        'listing_url': listing_url,
-                        'email_subject': item.get('email_subject') or 'No subject',
-                        'email_from': item.get('email_from') or 'Unknown',
-                        'created_at': item.get('processed_at') or item.get('created_at'),
-                        'status': 'error',
-                        'error': analysis_result.get('error')
-                    })
-                    continue
-                
-                # Only include items that have a report
-                if analysis_result and analysis_result.get('report'):
-                    analyses.append({
-                        'id': str(item.get('id')),
-                        'listing_url': listing_url,
-                        'email_subject': item.get('email_subject') or 'No subject',
-                        'email_from': item.get('email_from') or 'Unknown',
-                        'created_at': item.get('processed_at') or item.get('created_at'),
-                        'report': analysis_result.get('report'),
-                        'url': analysis_result.get('url', listing_url),
-                        'status': 'completed'
-                    })
+        # Rows already carry the response keys, so they are completed in place rather than copied
+        analyses = completed.data or []
+        for item in analyses:
+            item['email_subject'] = item['email_subject'] or 'No subject'
+            item['email_from'] = item['email_from'] or 'Unknown'
+            item['url'] = item['url'] or item['listing_url']
+            item['status'] = 'completed'
+        
+        pending_analyses = pending.data or []
+        for item in pending_analyses:
+            item['email_subject'] = item['email_subject'] or 'No subject'
+            item['email_from'] = item['email_from'] or 'Unknown'
+            # Rows with a result here carry an error (record exists but no analysis_result is pending)
+            if item['error']:
+                item['status'] = 'error'
+                logging.warning(f"Analysis error for {item['listing_url']}: {item['error']}")
+            else:
+                item['status'] = 'pending'
         
         logging.info(f"Returning {len(analyses)} completed analyses, {len(pending_analyses)} pending")
         
-        # Sort analyses by processed_at descending if we couldn't order in query
-        if analyses and not any('processed_at' in str(a.get('created_at', '')) for a in analyses[:1]):
-            analyses.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+        # Rows arrive ordered by processed_at, so both lists are already newest first.
+        # A full page of completed analyses means there may be more before the last one.
+        next_cursor = None
+        if len(analyses) >= limit:
+            last_row = analyses[-1]
+            next_cursor = f"{last_row['created_at']}|{last_row['id']}"
         
-        # Sort pending analyses too
-        if pending_analyses:
-            pending_analyses.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-        
-        # Always return success, even if no analyses found
-        return {
+        # Always return success, even if no analyses found. Returning the response directly
+        # lets orjson serialize the lists without FastAPI's jsonable_encoder pass.
+        return ORJSONResponse({
             "analyses": analyses, 
             "count": len(analyses),
             "pending": pending_analyses,
-            "pending_count": len(pending_analyses)
-        }
+            "pending_count": pending.count if pending.count is not None else len(pending_analyses),
+            "next_cursor": next_cursor
+        })
     except HTTPException:
         raise
     except Exception as e:
         error_msg = str(e)
-        logging.error(f"Error retrieving analyses: {error_msg}")
-        import traceback
-        logging.error(traceback.format_exc())
         
         # Provide more helpful error messages
-        if "does not exist" in error_msg.lower() or "relation" in error_msg.lower() or "table" in error_msg.lower():
-            raise HTTPException(
-                status_code=500, 
-                detail="The processed_emails table does not exist. Please run the database migration: supabase_schema_email.sql in your Supabase SQL Editor."
-            )
-        elif "permission" in error_msg.lower() or "policy" in error_msg.lower() or "row level security" in error_msg.lower():
-            raise HTTPException(
-                status_code=500,
-                detail="Permission denied. Please ensure Row Level Security policies are set up correctly for the processed_emails table."
-            )
-        elif "not found" in error_msg.lower() or "404" in error_msg.lower():
-            # If table doesn't exist or no records, return empty list instead of error
-            logging.warning("No analyses found or table doesn't exist, returning empty list")
-            return {"analyses": [], "count": 0}
-        else:
+        error_lower = error_msg.lower()
+        error_detail = next(
+            (detail for needles, detail in ANALYSES_ERROR_RULES if any(needle in error_lower for needle in needles)),
+            None
+        )
+        if error_detail is None and ("not found" in error_lower or "404" in error_lower):
+            # If table doesn't exist or no records, return empty list instead of error (expected, no traceback)
+            logger.debug("No analyses found or table doesn't exist, returning empty list")
+            return ORJSONResponse({"analyses": [], "count": 0})
+        logger.exception("Error retrieving analyses")
+        if error_detail is None:
             error_detail = f"Error retrieving analyses: {error_msg}"
             if hasattr(e, 'message'):
                 error_detail += f" - {e.message}"
-            raise HTTPException(status_code=500, detail=error_detail)
+        raise HTTPException(status_code=500, detail=error_detail)
+
+
+# Extracted criteria fields stored as-is in user_criteria columns
+CRITERIA_FIELDS = (
+    "property_type", "location", "min_rooms", "max_rooms", "min_living_space", "max_living_space",
+    "min_rent", "max_rent", "occupants", "duration", "starting_when"
+)
+
+
+def normalize_additional_requirements(additional_reqs) -> Optional[dict]:
+    """Map extracted additional requirements to the {"requirements": [...]} JSONB shape"""
+    if not additional_reqs or isinstance(additional_reqs, dict):
+        return additional_reqs or None
+    # Convert array to dict format
+    if isinstance(additional_reqs, list):
+        return {"requirements": additional_reqs}
+    # If it's a string or other type, wrap it
+    return {"requirements": [str(additional_reqs)]}
+
+
+# (label, min field, max field, min format, max format) for range lines in the criteria
+# summary; a None label is "Rent" or "Price" depending on the property type
+CRITERIA_SUMMARY_RANGES = (
+    ("Rooms", "min_rooms", "max_rooms", "{}+", "up to {}"),
+    ("Living Space", "min_living_space", "max_living_space", "{}m²+", "up to {}m²"),
+    (None, "min_rent", "max_rent", "CHF {}+", "up to CHF {}"),
+)
+
+
+def summarize_criteria(criteria: dict) -> List[str]:
+    """Markdown lines summarizing the criteria extracted from a chat message"""
+    criteria_summary = []
+    if criteria.get('property_type'):
+        criteria_summary.append(f"**Property Type:** {criteria['property_type'].title()}")
+    if criteria.get('location'):
+        criteria_summary.append(f"**Location:** {criteria['location']}")
+    for label, min_field, max_field, min_format, max_format in CRITERIA_SUMMARY_RANGES:
+        low, high = criteria.get(min_field), criteria.get(max_field)
+        if not (low or high):
+            continue
+        bounds = []
+        if low:
+            bounds.append(min_format.format(low))
+        if high:
+            bounds.append(max_format.format(high))
+        if label is None:
+            label = "Rent" if criteria.get('property_type') == 'rent' else "Price"
+        criteria_summary.append(f"**{label}:** {' '.join(bounds)}")
+    return criteria_summary
+
+
+async def save_chat_criteria(user_id: str, criteria: dict) -> Optional[str]:
+    """Save criteria extracted from a chat message to the user's profile; returns an error message on failure"""
+    try:
+        # Use service role client for backend operations (bypasses RLS since we verify JWT ourselves)
+        logger.info(f"Using supabase_admin client (service key: {'SET' if SUPABASE_SERVICE_KEY else 'NOT SET'})")
+        # Prepare criteria data - only include fields that exist in the schema,
+        # skipping None values (but keep empty strings and 0)
+        criteria_data = {field: criteria[field] for field in CRITERIA_FIELDS if criteria.get(field) is not None}
+        criteria_data["user_id"] = user_id
+        
+        # Add additional_requirements only if it exists
+        additional_reqs = normalize_additional_requirements(
+            criteria.get('additional_requirements') or criteria.get('user_additional_requirements')
+        )
+        if additional_reqs:
+            criteria_data["user_additional_requirements"] = additional_reqs
+        
+        logger.debug("Saving criteria for user %s: %r", user_id, criteria_data)
+        
+        # Insert or update in one round-trip (user_id is UNIQUE). Only the columns sent are
+        # overwritten, and created_at/updated_at come from column defaults and the update trigger.
+        query = supabase_admin.table("user_criteria").upsert(criteria_data, on_conflict="user_id")
+        response = await run_in_threadpool(query.execute)
+        logger.debug("Upserted criteria for user %s, response data: %r", user_id, response.data)
+        invalidate_user_criteria(user_id)
+        
+        if not response.data or len(response.data) == 0:
+            error_msg = "Database save returned no data"
+            logger.error(f"Failed to save criteria - {error_msg}")
+            raise Exception(error_msg)
+        
+        logger.info(f"Successfully saved criteria for user {user_id}")
+        return None
+    
+    except Exception as save_error:
+        error_msg = f"Failed to save criteria: {str(save_error)}"
+        logger.error(error_msg, exc_info=True)
+        return str(save_error)
+
+
+async def scrape_and_analyze_listing(client: httpx.AsyncClient, openai: httpx.AsyncClient, listing_url: str) -> tuple[dict, str]:
+    """Scrape a listing and analyze its images as soon as the scrape lands"""
+    listing_data = await call_firecrawl_scraper(client, listing_url)
+    if "error" in listing_data:
+        return listing_data, ""
+    # Analyze images (optional, can be skipped for speed)
+    image_analysis = await analyze_images(openai, listing_data.get('images', []), max_images=3)
+    return listing_data, image_analysis
 
 
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest, user_id: str = Depends(verify_token)):
+async def chat(
+    request: ChatRequest,
+    user_id: str = Depends(verify_token),
+    client: httpx.AsyncClient = Depends(get_http_client),
+    openai: httpx.AsyncClient = Depends(get_openai_client)
+):
     """
     Process a chat message with apartment criteria. Optionally analyze a listing URL if provided.
     """
@@ -1540,141 +2058,57 @@ async def chat(request: ChatRequest, user_id: str = Depends(verify_token)):
         # Extract URL from message (optional)
         user_message, listing_url = extract_url_from_message(request.message)
         
-        # Step 1: Extract user criteria from the message
-        criteria = extract_criteria_with_openai(user_message)
-        if "error" in criteria:
-            raise HTTPException(status_code=500, detail=f"Error extracting criteria: {criteria['error']}")
-        
-        # Step 2: Save criteria to user profile automatically
-        save_success = False
-        save_error_message = None
+        # Step 1: Extract user criteria from the message. The listing (if any) is scraped and
+        # its images analyzed at the same time, since none of that depends on the criteria.
+        listing_task = None
+        if listing_url:
+            listing_task = asyncio.create_task(scrape_and_analyze_listing(client, openai, listing_url))
         try:
-            # Use service role client for backend operations (bypasses RLS since we verify JWT ourselves)
-            logger.info(f"Using supabase_admin client (service key: {'SET' if SUPABASE_SERVICE_KEY else 'NOT SET'})")
-            # Check if criteria already exists
-            existing = supabase_admin.table("user_criteria").select("*").eq("user_id", user_id).execute()
-            
-            # Prepare criteria data - only include fields that exist in the schema
-            # Map OpenAI extracted fields to database fields
-            additional_reqs = criteria.get('additional_requirements') or criteria.get('user_additional_requirements')
-            # Convert array to dict if needed, or keep as dict
-            if isinstance(additional_reqs, list):
-                # Convert array to dict format
-                additional_reqs = {"requirements": additional_reqs}
-            elif additional_reqs and not isinstance(additional_reqs, dict):
-                # If it's a string or other type, wrap it
-                additional_reqs = {"requirements": [str(additional_reqs)]}
+            criteria = await extract_criteria_with_openai(openai, user_message)
+            if "error" in criteria:
+                raise HTTPException(status_code=500, detail=f"Error extracting criteria: {criteria['error']}")
             
-            criteria_data = {
-                "user_id": user_id,
-                "property_type": criteria.get('property_type'),
-                "location": criteria.get('location'),
-                "min_rooms": criteria.get('min_rooms'),
-                "max_rooms": criteria.get('max_rooms'),
-                "min_living_space": criteria.get('min_living_space'),
-                "max_living_space": criteria.get('max_living_space'),
-                "min_rent": criteria.get('min_rent'),
-                "max_rent": criteria.get('max_rent'),
-                "occupants": criteria.get('occupants'),
-                "duration": criteria.get('duration'),
-                "starting_when": criteria.get('starting_when'),
-            }
-            
-            # Add additional_requirements only if it exists
-            if additional_reqs:
-                criteria_data["user_additional_requirements"] = additional_reqs
-            
-            # Remove None values (but keep empty strings and 0)
-            criteria_data = {k: v for k, v in criteria_data.items() if v is not None}
-            
-            logger.info(f"Saving criteria for user {user_id}: {criteria_data}")
-            
-            if existing.data and len(existing.data) > 0:
-                # Update existing
-                criteria_id = existing.data[0]["id"]
-                criteria_data["updated_at"] = datetime.utcnow().isoformat()
-                response = supabase_admin.table("user_criteria").update(criteria_data).eq("id", criteria_id).execute()
-                logger.info(f"Updated criteria for user {user_id}, response data: {response.data}")
+            # Step 2: Save criteria to user profile automatically, while the listing work finishes
+            if listing_task:
+                save_error_message, (listing_data, image_analysis) = await asyncio.gather(
+                    save_chat_criteria(user_id, criteria),
+                    listing_task
+                )
             else:
-                # Create new
-                criteria_data["created_at"] = datetime.utcnow().isoformat()
-                criteria_data["updated_at"] = datetime.utcnow().isoformat()
-                response = supabase_admin.table("user_criteria").insert(criteria_data).execute()
-                logger.info(f"Created new criteria for user {user_id}, response data: {response.data}")
-                
-            if not response.data or len(response.data) == 0:
-                error_msg = "Database save returned no data"
-                logger.error(f"Failed to save criteria - {error_msg}")
-                raise Exception(error_msg)
-            
-            logger.info(f"Successfully saved criteria for user {user_id}")
-            save_success = True
-                
-        except Exception as save_error:
-            error_msg = f"Failed to save criteria: {str(save_error)}"
-            logger.error(error_msg, exc_info=True)
-            save_success = False
-            save_error_message = str(save_error)
+                save_error_message = await save_chat_criteria(user_id, criteria)
+        finally:
+            # Stop the scrape and OpenAI calls if extracting or saving the criteria failed
+            if listing_task and not listing_task.done():
+                listing_task.cancel()
+        save_success = save_error_message is None
         
         # Step 3: If URL provided, analyze the listing
         if listing_url:
-            # Scrape listing
-            listing_data = call_firecrawl_scraper(listing_url)
             if "error" in listing_data:
-                return ChatResponse(
+                return ORJSONResponse(ChatResponse(
                     response=f"✅ Your preferences have been saved to your profile!\n\nHowever, I couldn't analyze the listing URL: {listing_data['error']}\n\nYou can view and edit your saved preferences in your Profile page.",
                     status="success"
-                )
+                ).model_dump())
             
-            # Analyze images (optional, can be skipped for speed)
-            print(f"[Debug] Starting image analysis...")
-            image_analysis = analyze_images(listing_data.get('content', ''), max_images=3)
-            print(f"[Debug] Image analysis length: {len(image_analysis)}")
-            print(f"[Debug] Image analysis result: {image_analysis[:500]}...")  # First 500 chars
-            print(f"[Debug] Image analysis is valid: {image_analysis not in ['No images found to analyze', 'Image analysis skipped (no API key)']}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Image analysis length: %d", len(image_analysis))
+                logger.debug("Image analysis result: %.500s...", image_analysis)  # First 500 chars
+                logger.debug("Image analysis is valid: %s", image_analysis not in NO_IMAGE_ANALYSIS_RESULTS)
             
-            # Generate match report
-            print(f"[Debug] Generating match report with image_analysis={bool(image_analysis)}")
-            match_report = generate_match_report(criteria, listing_data, image_analysis)
-            
-            return ChatResponse(
-                response=match_report,
-                status="success"
+            # Stream the match report so the browser can render it as it is generated
+            return StreamingResponse(
+                report_event_stream(stream_match_report(openai, criteria, listing_data, image_analysis)),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
             )
         else:
             # No URL provided - just confirm criteria was saved
-            criteria_summary = []
-            if criteria.get('property_type'):
-                criteria_summary.append(f"**Property Type:** {criteria['property_type'].title()}")
-            if criteria.get('location'):
-                criteria_summary.append(f"**Location:** {criteria['location']}")
-            if criteria.get('min_rooms') or criteria.get('max_rooms'):
-                rooms = []
-                if criteria.get('min_rooms'):
-                    rooms.append(f"{criteria['min_rooms']}+")
-                if criteria.get('max_rooms'):
-                    rooms.append(f"up to {criteria['max_rooms']}")
-                criteria_summary.append(f"**Rooms:** {' '.join(rooms)}")
-            if criteria.get('min_living_space') or criteria.get('max_living_space'):
-                space = []
-                if criteria.get('min_living_space'):
-                    space.append(f"{criteria['min_living_space']}m²+")
-                if criteria.get('max_living_space'):
-                    space.append(f"up to {criteria['max_living_space']}m²")
-                criteria_summary.append(f"**Living Space:** {' '.join(space)}")
-            if criteria.get('min_rent') or criteria.get('max_rent'):
-                price_label = "Rent" if criteria.get('property_type') == 'rent' else "Price"
-                price = []
-                if criteria.get('min_rent'):
-                    price.append(f"CHF {criteria['min_rent']}+")
-                if criteria.get('max_rent'):
-                    price.append(f"up to CHF {criteria['max_rent']}")
-                criteria_summary.append(f"**{price_label}:** {' '.join(price)}")
+            criteria_summary = summarize_criteria(criteria)
             
             summary_text = "\n".join(criteria_summary) if criteria_summary else "Your preferences"
             
             if save_success:
-                return ChatResponse(
+                return ORJSONResponse(ChatResponse(
                     response=f"""✅ **Your preferences have been saved!**
 
 {summary_text}
@@ -1686,9 +2120,9 @@ You can:
 
 To analyze a specific listing, just paste a URL from any property website along with your message!""",
                     status="success"
-                )
+                ).model_dump())
             else:
-                return ChatResponse(
+                return ORJSONResponse(ChatResponse(
                     response=f"""⚠️ **Preferences extracted but couldn't be saved automatically**
 
 {summary_text}
@@ -1697,55 +2131,87 @@ To analyze a specific listing, just paste a URL from any property website along
 
 Error: {save_error_message}""",
                     status="warning"
-                )
+                ).model_dump())
     
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"[ERROR] Exception in /api/chat endpoint:")
-        print(error_details)
+        logger.exception("Exception in /api/chat endpoint")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Pages are read once at import instead of from disk on every request (restart to pick up edits)
+with open("static/profile.html", "rb") as f:
+    PROFILE_HTML = f.read()
+with open("static/index.html", "rb") as f:
+    INDEX_HTML = f.read()
+
+
 @app.get("/profile", response_class=HTMLResponse)
 async def read_profile():
     """Serve the profile page"""
-    with open("static/profile.html", "r") as f:
-        return f.read()
+    return HTMLResponse(content=PROFILE_HTML)
 
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root():
     """Serve the main HTML page"""
-    with open("static/index.html", "r") as f:
-        return f.read()
+    return HTMLResponse(content=INDEX_HTML)
 
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 
+# Users whose mailboxes are checked at the same time by the periodic task
+MAX_CONCURRENT_EMAIL_CHECKS = 16
+# The only user_criteria columns a scheduled email check reads
+EMAIL_MONITORING_COLUMNS = "user_id,monitor_email,email_app_password,email_provider,email_sender,email_subject_keywords"
+
+# Users with monitoring enabled, reused across periodic ticks; the profile endpoints clear it
+MONITORED_USERS_CACHE_TTL_SECONDS = 1800
+_monitored_users_cache = TTLCache(maxsize=1, ttl=MONITORED_USERS_CACHE_TTL_SECONDS)
+
+
+async def load_monitored_users() -> List[dict]:
+    """Fetch email settings for every user with monitoring enabled (cached)"""
+    users = _monitored_users_cache.get("users")
+    if users is None:
+        query = supabase_admin.table("user_criteria").select(EMAIL_MONITORING_COLUMNS).eq("email_monitoring_enabled", True)
+        response = await run_in_threadpool(query.execute)
+        users = _monitored_users_cache["users"] = response.data or []
+    return users
+
+
+async def check_user_email(user_criteria: dict, semaphore: asyncio.Semaphore):
+    """Run one user's scheduled email check, logging failures so other users' checks continue"""
+    user_id = user_criteria.get('user_id')
+    email_address = user_criteria.get('monitor_email')
+    app_password = user_criteria.get('email_app_password')
+    email_provider = user_criteria.get('email_provider', 'gmail')
+    email_sender = user_criteria.get('email_sender')
+    email_subject_keywords = user_criteria.get('email_subject_keywords')
+    
+    if email_address and app_password:
+        async with semaphore:
+            try:
+                await process_new_email_listings(user_id, email_address, app_password, email_provider, email_sender, email_subject_keywords)
+            except Exception as e:
+                logger.error(f"Error checking email for user {user_id}: {str(e)}")
+
+
 async def periodic_email_check():
     """Background task to periodically check emails for all users with monitoring enabled"""
     while True:
         try:
             # Get all users with email monitoring enabled
-            response = supabase_admin.table("user_criteria").select("*").eq("email_monitoring_enabled", True).execute()
+            monitored_users = await load_monitored_users()
             
-            if response.data:
-                for user_criteria in response.data:
-                    user_id = user_criteria.get('user_id')
-                    email_address = user_criteria.get('monitor_email')
-                    app_password = user_criteria.get('email_app_password')
-                    email_provider = user_criteria.get('email_provider', 'gmail')
-                    email_sender = user_criteria.get('email_sender')
-                    email_subject_keywords = user_criteria.get('email_subject_keywords')
-                    
-                    if email_address and app_password:
-                        try:
-                            await process_new_email_listings(user_id, email_address, app_password, email_provider, email_sender, email_subject_keywords)
-                        except Exception as e:
-                            logger.error(f"Error checking email for user {user_id}: {str(e)}")
+            if monitored_users:
+                # Check mailboxes concurrently so one slow IMAP server doesn't hold up everyone else
+                semaphore = asyncio.Semaphore(MAX_CONCURRENT_EMAIL_CHECKS)
+                await asyncio.gather(
+                    *(check_user_email(user_criteria, semaphore) for user_criteria in monitored_users),
+                    return_exceptions=True
+                )
             
             # Wait 5 minutes before next check
             await asyncio.sleep(300)
@@ -1758,11 +2224,40 @@ async def periodic_email_check():
 @app.on_event("startup")
 async def startup_event():
     """Start background tasks on application startup"""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    # Shared HTTP client so outbound API calls reuse pooled keep-alive connections
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(60.0),
+        limits=httpx.Limits(max_keepalive_connections=100)
+    )
+    # Dedicated OpenAI client: every completion call multiplexes over the same
+    # HTTP/2 connection instead of paying a TLS handshake each time
+    app.state.openai = httpx.AsyncClient(
+        base_url="https://api.openai.com/v1",
+        http2=True,
+        headers={
+            "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY', '')}",
+            "Content-Type": "application/json"
+        },
+        timeout=httpx.Timeout(60.0),
+        limits=httpx.Limits(max_keepalive_connections=32)
+    )
     asyncio.create_task(periodic_email_check())
     logger.info("Email monitoring background task started")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release shared resources on application shutdown"""
+    await app.state.http.aclose()
+    await app.state.openai.aclose()
+    await run_in_threadpool(close_imap_pool)
+
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # uvloop/httptools are picked up automatically where installed (not on Windows). A single worker
+    # keeps one periodic email check task per deployment.
+    uvicorn.run(app, host="0.0.0.0", port=port, loop="auto", http="auto")
@@ -0,0 +1,12 @@
+-- Migration: Partial indexes for the email analyses endpoint
+-- Run this in Supabase SQL Editor after supabase_schema_email.sql
+
+-- Completed analyses (report present, no error), newest first per user
+CREATE INDEX IF NOT EXISTS idx_processed_emails_completed
+ON processed_emails(user_id, processed_at DESC, id DESC)
+WHERE (analysis_result -> 'report') IS NOT NULL AND (analysis_result -> 'error') IS NULL;
+
+-- Analyses still pending (no result yet) or failed (error recorded), newest first per user
+CREATE INDEX IF NOT EXISTS idx_processed_emails_pending
+ON processed_emails(user_id, processed_at DESC)
+WHERE analysis_result IS NULL OR (analysis_result -> 'error') IS NOT NULL;
@@ -0,0 +1,12 @@
+-- Migration: Ensure processed_emails.analysis_result holds JSON objects
+-- Run this in Supabase SQL Editor after supabase_schema_email.sql
+
+-- Convert the column if it was created as TEXT (no-op rewrite when it is already JSONB)
+ALTER TABLE processed_emails
+ALTER COLUMN analysis_result TYPE JSONB USING analysis_result::jsonb;
+
+-- Unwrap results that were stored as a JSON-encoded string instead of an object,
+-- so the analyses endpoint can read report/url/error straight from the column
+UPDATE processed_emails
+SET analysis_result = (analysis_result #>> '{}')::jsonb
+WHERE jsonb_typeof(analysis_result) = 'string';
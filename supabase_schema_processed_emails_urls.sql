@@ -0,0 +1,29 @@
+-- Migration: Track processed emails per listing URL
+-- Run this in Supabase SQL Editor after supabase_schema_email.sql
+
+-- One email can contain several listings, and each one gets its own row.
+-- The old (user_id, email_message_id) constraint rejected every row after the first.
+ALTER TABLE processed_emails
+DROP CONSTRAINT IF EXISTS processed_emails_user_id_email_message_id_key;
+
+-- Older code only enforced (user_id, email_message_id), so the same listing may already be
+-- recorded several times for a user. Keep one row per (user_id, listing_url), preferring a
+-- completed report and then the newest row, and delete the rest, otherwise the constraint
+-- below cannot be added.
+DELETE FROM processed_emails
+WHERE id IN (
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (
+            PARTITION BY user_id, listing_url
+            ORDER BY (analysis_result -> 'report') IS NOT NULL DESC, processed_at DESC, id DESC
+        ) AS row_rank
+        FROM processed_emails
+        WHERE listing_url IS NOT NULL
+    ) ranked
+    WHERE row_rank > 1
+);
+
+-- Each listing is recorded once per user; the backend batch-inserts new rows with
+-- upsert(on_conflict='user_id,listing_url') so re-sent listings are skipped
+ALTER TABLE processed_emails
+ADD CONSTRAINT processed_emails_user_id_listing_url_key UNIQUE (user_id, listing_url);